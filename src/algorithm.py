@@ -3,98 +3,577 @@ algorithm.py
 The genetic algorithm engine.
 04/2020 Kamil Zacharczuk
 """
+import array
+import heapq
 import itertools
+import math
 import random
+import time
+from collections import OrderedDict
 from magazine import *
+from parallel import ParallelEvaluator
+from incremental import PrefixDecoder
+from metrics import GenerationObserver
 
-def performAlgorithm(magazine, boxes, populationSize, iterations, mutationProbability):
+class FitnessCache:
+    # Bounded LRU cache of fitness values of already decoded genotypes, keyed by genotypeKey.
+    def __init__(self, maxSize):
+        self.max_size = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.values = OrderedDict()
+
+    def get(self, key):
+        fitness = self.values.get(key)
+        if (fitness is None):
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.values.move_to_end(key)
+        return fitness
+
+    def put(self, key, fitness):
+        self.values[key] = fitness
+        self.values.move_to_end(key)
+        if (len(self.values) > self.max_size):
+            self.values.popitem(last=False)
+
+# Genotypes are arrays of box type ids (see magazine.BoxTypes), their bytes identify the sequence of box dimensions.
+def genotypeKey(genotype):
+    return genotype.tobytes()
+
+# A new array with the genes of the genotype - an array or a row of GenerationBuffers.
+def copyGenotype(genotype):
+    return array.array(genotype.typecode if isinstance(genotype, array.array) else genotype.format, genotype)
+
+# The winner and the genotypes given to the progressCallback are permutations of indexes into the boxes list.
+# Internally the genotypes are sequences of box types, so orders differing only in identical boxes are one genotype.
+# If a stats dict is given, it is filled with the numbers of generations, fitness evaluations and decodes,
+# and with incremental decoding in this process with the boxes inserted and skipped by the PrefixDecoder.
+# progressCallback(generation, best fitness, mean fitness, evaluations per second, best genotype)
+# is called after every generation. Setting the stopEvent (threading.Event) stops the algorithm,
+# the best genotype found so far is returned.
+# The observer (see metrics.py) gets the metrics of every generation and the totals of the run.
+# The algorithm stops before all the iterations are run (see StoppingCriteria) after stallGenerations
+# generations without improvement, when the best fitness reaches targetFitness or the upper bound
+# of the fill factor (unless stopAtUpperBound is False), or after timeBudget seconds.
+# The criterion which stopped the algorithm is put into stats as "stop_reason".
+# All the random choices are made with rng (random.Random or the random module), so seeding it
+# makes the run repeatable. With a checkpointPath the run is saved every checkpointInterval
+# generations and at its end (see checkpoint.py); resumeFrom is a loaded checkpoint to continue from.
+# With batchEvaluation the genotypes of a generation are decoded together, in lockstep (see batch.py).
+# By default every pair of the population gives two children. With an offspringCount that many children
+# are made of parents chosen by parentSelection: "tournament", "roulette", "rank" or a function
+# like tournamentSelection. With elitism only that many best parents survive to the next generation,
+# otherwise the best of the parents and the children do.
+# With localSearch the localSearch best genotypes of every generation are improved by trying
+# localSearchMoves moves of single boxes (see localsearch.py).
+# initialPopulation (permutations of box indexes) is the start of the first population, filled up
+# with random genotypes; finalPopulation, if a list is given, gets the last population, best first.
+# checkpointLayout tells the checkpoints that the magazine was given as a layout, to be resumed as one.
+def performAlgorithm(magazine, boxes, populationSize, iterations, mutationProbability, fitnessCache=None,
+                     workers=1, incremental=False, batchOperators=False, stats=None, progressCallback=None,
+                     stopEvent=None, observer=None, stallGenerations=None, targetFitness=None, timeBudget=None,
+                     stopAtUpperBound=True, rng=random, checkpointPath=None, checkpointInterval=10,
+                     resumeFrom=None, batchEvaluation=False, offspringCount=None, parentSelection="tournament",
+                     elitism=None, localSearch=0, localSearchMoves=32, initialPopulation=None,
+                     finalPopulation=None, checkpointLayout=False):
+    if (offspringCount is not None and offspringCount < 0):
+        raise ValueError("The offspring count cannot be negative: " + str(offspringCount))
     if (not boxes): return []
 
+    box_types = BoxTypes(boxes)
+    stopping = StoppingCriteria(stallGenerations, targetFitness,
+                                getUpperBound(magazine, boxes) if stopAtUpperBound else None, timeBudget)
+    population = None
+    generation = 0
+    batch_rng = None
+    if (initialPopulation and resumeFrom is None):
+        population = [array.array(box_types.typecode, [box_types.type_ids[i] for i in p])
+                      for p in initialPopulation[:populationSize]]
+        population += createRandomPopulation(box_types, populationSize - len(population), rng)
+    if (resumeFrom is not None):
+        from checkpoint import unpackGenotypes
+        population = unpackGenotypes(resumeFrom["population"], len(boxes), box_types.typecode)
+        generation = resumeFrom["generation"]
+        rng = random.Random()
+        rng.setstate(resumeFrom["rng_state"])
+        if (batchOperators and resumeFrom["batch_rng_state"] is not None):
+            import vectorized
+            batch_rng = vectorized.createGenerator(rng, resumeFrom["batch_rng_state"])
+        stopping.best, stopping.stalled = resumeFrom["best"], resumeFrom["stalled"]
+    checkpointer = None
+    if (checkpointPath is not None):
+        from checkpoint import Checkpointer
+        checkpointer = Checkpointer(checkpointPath, checkpointInterval, magazine, boxes, populationSize,
+                                    iterations, mutationProbability, batchOperators, offspringCount,
+                                    parentSelection, elitism, localSearch, localSearchMoves, checkpointLayout)
+        checkpointer.saved_generation = generation if resumeFrom is not None else None
+
+    callback = None
+    if (progressCallback is not None):
+        def callback(generation, best, mean, evaluationsPerSecond, genotype):
+            progressCallback(generation, best, mean, evaluationsPerSecond, box_types.boxIndexes(genotype))
+
+    fitness = createFitnessFunction(magazine, box_types.types, fitnessCache, workers, incremental, batchEvaluation)
+    local_search = None
+    if (localSearch > 0):
+        from localsearch import LocalSearch
+        local_search = LocalSearch(magazine, box_types.types, localSearch, localSearchMoves)
+    try:
+        population, fitness_values, generations = evolve(box_types, populationSize, iterations, mutationProbability,
+                                                         fitness, batchOperators, callback, stopEvent,
+                                                         observer if observer is not None else GenerationObserver(),
+                                                         population, stopping, rng, generation, batch_rng,
+                                                         checkpointer, offspringCount, parentSelection, elitism,
+                                                         local_search)
+    finally:
+        fitness.close()
+
+    if (stats is not None):
+        stats.update(generations=generations, evaluations=fitness.evaluations, decodes=fitness.decodes,
+                     stop_reason=stopping.reason)
+        if (local_search is not None):
+            stats.update(local_search_moves=local_search.evaluated_moves,
+                         local_search_improvements=local_search.improvements)
+        if (isinstance(fitness.evaluator, PrefixDecoder)):
+            stats.update(prefix_add_box_calls=fitness.evaluator.add_box_calls,
+                         prefix_skipped_boxes=fitness.evaluator.skipped_boxes)
+    if (finalPopulation is not None):
+        finalPopulation[:] = [box_types.boxIndexes(g) for g in population]
+    return box_types.boxIndexes(population[0])
+
+# No placement can fill more than all the boxes together, nor more than the whole magazine.
+def getUpperBound(magazine, boxes):
+    free_fields = magazine.X*magazine.Y - magazine.wall_blocks_count
+    if (free_fields <= 0): return 0.0
+    return min(1.0, sum(b.len_x*b.len_y for b in boxes) / free_fields)
+
+class StoppingCriteria:
+    # Conditions which end the algorithm before all the iterations are run, checked after every generation.
+    # None turns a criterion off. The reason is the name of the criterion which fired:
+    # "stall", "target", "upper_bound" or "time_budget"; evolve sets it to "iterations" or "cancelled" otherwise.
+    # Fill factors are sums of floats, so the bounds are compared with a small tolerance.
+    TOLERANCE = 1e-9
+
+    def __init__(self, stallGenerations=None, targetFitness=None, upperBound=None, timeBudget=None):
+        self.stall_generations = stallGenerations
+        self.target_fitness = targetFitness
+        self.upper_bound = upperBound
+        self.time_budget = timeBudget
+        self.reason = None
+        self.start_time = time.perf_counter()
+        self.best = None
+        self.stalled = 0
+
+    # Returns the reason to stop after a generation with the given best fitness, or None.
+    # generations is the number of the generations run since the previous check.
+    def check(self, best, generations=1):
+        if (self.best is not None and best <= self.best):
+            self.stalled += generations
+        else:
+            self.best = best
+            self.stalled = 0
+
+        if (self.target_fitness is not None and best >= self.target_fitness - self.TOLERANCE):
+            self.reason = "target"
+        elif (self.upper_bound is not None and best >= self.upper_bound - self.TOLERANCE):
+            self.reason = "upper_bound"
+        elif (self.stall_generations is not None and self.stalled >= self.stall_generations):
+            self.reason = "stall"
+        elif (self.time_budget is not None and time.perf_counter() - self.start_time >= self.time_budget):
+            self.reason = "time_budget"
+        return self.reason
+
+# boxes are the box types, the genotypes are decoded with.
+def createFitnessFunction(magazine, boxes, fitnessCache=None, workers=1, incremental=False, batchEvaluation=False):
+    # With more than one worker the genotypes are decoded in a process pool.
+    # Batch evaluation decodes all the genotypes at once with NumPy arrays, on a single core.
+    # Incremental decoding resumes from saved states of the magazine for already decoded box prefixes.
+    evaluator = None
+    if (workers > 1):
+        evaluator = ParallelEvaluator(magazine, boxes, workers, incremental)
+    elif (batchEvaluation):
+        from batch import BatchEvaluator
+        evaluator = BatchEvaluator(magazine, boxes)
+    elif (incremental):
+        evaluator = PrefixDecoder(magazine, boxes)
+    return FitnessFunction(magazine, boxes, fitnessCache, evaluator)
+
+def createRandomPopulation(boxTypes, populationSize, rng=random):
     # Initial population is a set of populationSize random permutations of the boxes
     population = []
     while (len(population) < populationSize):
-        perm = boxes[:] 
-        random.shuffle(perm)
+        perm = array.array(boxTypes.typecode, boxTypes.type_ids)
+        rng.shuffle(perm)
         population.append(perm)
+    return population
+
+class GenerationBuffers:
+    # Preallocated genotypes of the population and of the children of a generation - rows of one flat array,
+    # each used through a memoryview - and their fitness values. The population and the children
+    # are lists of row numbers: the children are written into free rows and the new population is chosen
+    # by reordering the row numbers, so no genotype is allocated or copied while the algorithm runs.
+    def __init__(self, typecode, genotypeLength, rowsCount):
+        self.typecode = typecode
+        self.genes = array.array(typecode, [0]) * (rowsCount * genotypeLength)
+        genes = memoryview(self.genes)
+        self.rows = [genes[i*genotypeLength:(i+1)*genotypeLength] for i in range(rowsCount)]
+        self.fitness = array.array("d", [0.0]) * rowsCount
+        self.matrix = None
+
+    # The genes as a 2D NumPy array sharing the memory of the rows, for the batch operators.
+    def getMatrix(self):
+        if (self.matrix is None):
+            import numpy as np
+            self.matrix = np.frombuffer(self.genes, dtype=self.typecode).reshape(len(self.rows), -1)
+        return self.matrix
+
+    def getGenotypes(self, rows):
+        return [self.rows[r] for r in rows]
+
+    # Copies of the genotypes of the rows, valid after the rows are reused.
+    def copyGenotypes(self, rows):
+        return [copyGenotype(self.rows[r]) for r in rows]
+
+# Runs the main algorithm loop, starting from the given population or from a random one.
+# The generations are counted from the given one, up to iterations.
+# Returns the last population sorted by fitness, its fitness values and the number of the last generation.
+# If stopping criteria are given, their reason tells why the loop ended.
+# batchRng is the NumPy generator of the batch operators, by default seeded from rng.
+# offspringCount, parentSelection and elitism are described at performAlgorithm.
+# localSearch (localsearch.LocalSearch) improves the best genotypes of every generation.
+# The genotypes given to the progressCallback, the checkpointer and the local search are rows of
+# the generation buffers, overwritten in the next generations.
+def evolve(boxTypes, populationSize, iterations, mutationProbability, fitness, batchOperators,
+           progressCallback=None, stopEvent=None, observer=GenerationObserver(), population=None,
+           stopping=None, rng=random, generation=0, batchRng=None, checkpointer=None, offspringCount=None,
+           parentSelection="tournament", elitism=None, localSearch=None):
+    if (stopping is None):
+        stopping = StoppingCriteria()
+    if (population is None):
+        population = createRandomPopulation(boxTypes, populationSize, rng)
+
+    # Rows for the largest population and all its children, two for every pair of parents.
+    rows_count = max(len(population), populationSize)
+    if (offspringCount is not None): children_count = 2 * ((offspringCount + 1) // 2)
+    else: children_count = rows_count * (rows_count - 1)
+    buffers = GenerationBuffers(boxTypes.typecode, len(boxTypes.type_ids), rows_count + children_count)
+    for r, genotype in enumerate(population):
+        buffers.rows[r][:] = genotype
+    population = list(range(len(population)))
+    free_rows = list(range(len(population), len(buffers.rows)))
+
+    fitness_values = [0.0]
+    select_parents = None
+    if (offspringCount is not None):
+        select_parents = getParentSelection(parentSelection)
+        # The parents of the first generation are chosen by their fitness values too.
+        fitness_values = fitness(buffers.getGenotypes(population))
+        for r, fitness_value in zip(population, fitness_values):
+            buffers.fitness[r] = fitness_value
+
+    if (batchOperators):
+        # NumPy operators producing all the children of a generation at once.
+        import numpy as np
+        import vectorized
+        if (batchRng is None): batchRng = vectorized.createGenerator(rng)
+        matrix = buffers.getMatrix()
+        crossover_buffers = vectorized.CrossoverBuffers(children_count, matrix.shape[1], matrix.dtype)
+    else:
+        batchRng = None
 
     # Main algorithm loop
-    for i in range(iterations):
-        children = performCrossover(population)
-        performMutation(children, mutationProbability)
-        population = chooseNewPopulation(population, children, populationSize, magazine)
+    start_time = time.perf_counter()
+    generations = generation
+    totals = {"crossover_time": 0.0, "mutation_time": 0.0, "evaluation_time": 0.0, "selection_time": 0.0,
+              "local_search_time": 0.0}
+    stopping.reason = None
+    for i in range(generation, iterations):
+        if (stopEvent is not None and stopEvent.is_set()):
+            stopping.reason = "cancelled"
+            break
+        evaluations, decodes, cache_hits = fitness.evaluations, fitness.decodes, fitness.cacheHits()
+
+        step_start = time.perf_counter()
+        pairs = None
+        if (select_parents is not None):
+            pairs = selectParentPairs(fitness_values, offspringCount, select_parents, rng)
+        if (batchOperators):
+            # The parents are read from their rows, given by the pairs of row numbers.
+            if (pairs is None): pairs = np.column_stack(np.triu_indices(len(population), 1))
+            pairs_rows = np.array(population)[np.asarray(pairs, dtype=np.intp).reshape(-1, 2)]
+            children = vectorized.performCrossover(matrix, boxTypes.counts, batchRng, pairs_rows, crossover_buffers)
+            if (offspringCount is not None): children = children[:offspringCount]
+            crossover_end = time.perf_counter()
+            vectorized.performMutation(children, mutationProbability, batchRng)
+            children_rows = free_rows[:len(children)]
+            matrix[children_rows] = children
+        else:
+            parents = buffers.getGenotypes(population)
+            pairs_count = len(pairs) if pairs is not None else len(parents) * (len(parents) - 1) // 2
+            children_rows = free_rows[:2*pairs_count]
+            children = performCrossover(parents, boxTypes.counts, rng, pairs, buffers.getGenotypes(children_rows))
+            if (offspringCount is not None):
+                del children[offspringCount:]
+                del children_rows[offspringCount:]
+            crossover_end = time.perf_counter()
+            performMutation(children, mutationProbability, rng)
+        mutation_end = time.perf_counter()
+        candidates = population + children_rows
+        for r, fitness_value in zip(candidates, fitness(buffers.getGenotypes(candidates))):
+            buffers.fitness[r] = fitness_value
+        evaluation_end = time.perf_counter()
+        population = chooseNewPopulation(candidates, buffers.fitness, populationSize, elitism, len(population))
+        selection_end = time.perf_counter()
+        if (localSearch is not None):
+            population = improvePopulation(population, buffers, localSearch, fitness, rng)
+        local_search_end = time.perf_counter()
+        survivors = set(population)
+        free_rows = [r for r in range(len(buffers.rows)) if r not in survivors]
+        fitness_values = [buffers.fitness[r] for r in population]
+        generations += 1
+
+        metrics = {
+            "generation": generations,
+            "crossover_time": crossover_end - step_start,
+            "mutation_time": mutation_end - crossover_end,
+            "evaluation_time": evaluation_end - mutation_end,
+            "selection_time": selection_end - evaluation_end,
+            "local_search_time": local_search_end - selection_end,
+            "evaluations": fitness.evaluations - evaluations,
+            "decodes": fitness.decodes - decodes,
+            "cache_hits": fitness.cacheHits() - cache_hits,
+            "best": fitness_values[0],
+            "mean": sum(fitness_values)/len(fitness_values),
+            "worst": fitness_values[-1],
+            "diversity": len({genotypeKey(buffers.rows[r]) for r in population}) / len(population),
+        }
+        for key in totals:
+            totals[key] += metrics[key]
+        observer.onGeneration(metrics)
+
+        if (progressCallback is not None):
+            evaluations_per_second = fitness.evaluations / max(time.perf_counter() - start_time, 1e-9)
+            progressCallback(generations, fitness_values[0], sum(fitness_values)/len(fitness_values),
+                             evaluations_per_second, buffers.rows[population[0]])
 
-    return population[0]
+        reason = stopping.check(fitness_values[0])
+        if (checkpointer is not None and generations % checkpointer.interval == 0):
+            checkpointer.save(generations, buffers.getGenotypes(population), rng, batchRng, stopping)
+        if (reason is not None): break
+    else:
+        stopping.reason = "iterations"
+    if (checkpointer is not None):
+        checkpointer.save(generations, buffers.getGenotypes(population), rng, batchRng, stopping)
 
-def performCrossover(population):
-    children = []
+    observer.onFinish(dict(totals, generations=generations, evaluations=fitness.evaluations,
+                           decodes=fitness.decodes, cache_hits=fitness.cacheHits(), best=fitness_values[0],
+                           stop_reason=stopping.reason))
+    return (buffers.copyGenotypes(population), fitness_values, generations)
+
+# Improve the localSearch.elite best genotypes of the population (rows of the buffers sorted by fitness).
+# The improved genotypes are written into their rows; returns the rows sorted by fitness again.
+def improvePopulation(population, buffers, localSearch, fitness, rng=random):
+    improved = False
+    for r in population[:localSearch.elite]:
+        genotype, fitness_value = localSearch.improve(copyGenotype(buffers.rows[r]), rng)
+        if (fitness_value > buffers.fitness[r]):
+            buffers.rows[r][:] = genotype
+            buffers.fitness[r] = fitness_value
+            fitness.remember(genotype, fitness_value)
+            improved = True
+    if (improved):
+        population = sorted(population, key=buffers.fitness.__getitem__, reverse=True)
+    return population
+
+# Parent selection strategies. They get the fitness values of the population and return
+# the indexes of count parents, chosen at random with repetitions.
+TOURNAMENT_SIZE = 3
+
+def tournamentSelection(fitnessValues, count, rng=random):
+    # Every parent is the best of TOURNAMENT_SIZE genotypes drawn at random.
+    size = len(fitnessValues)
+    parents = []
+    for i in range(count):
+        parents.append(max([rng.randrange(size) for j in range(TOURNAMENT_SIZE)], key=fitnessValues.__getitem__))
+    return parents
+
+def rouletteSelection(fitnessValues, count, rng=random):
+    # The probability of a genotype is proportional to its fitness value, the same for all if they are all 0.
+    if (sum(fitnessValues) <= 0):
+        return [rng.randrange(len(fitnessValues)) for i in range(count)]
+    return rng.choices(range(len(fitnessValues)), weights=fitnessValues, k=count)
+
+def rankSelection(fitnessValues, count, rng=random):
+    # The probability of a genotype is proportional to its rank: 1 for the worst one, up to the population size.
+    order = sorted(range(len(fitnessValues)), key=fitnessValues.__getitem__)
+    return rng.choices(order, weights=range(1, len(order) + 1), k=count)
+
+def getParentSelection(selection):
+    if (callable(selection)):
+        return selection
+    if (selection == "tournament"):
+        return tournamentSelection
+    if (selection == "roulette"):
+        return rouletteSelection
+    if (selection == "rank"):
+        return rankSelection
+    raise ValueError("Unknown parent selection: " + str(selection))
+
+# Index pairs of the parents of offspringCount children, every pair gives two of them.
+def selectParentPairs(fitnessValues, offspringCount, selectParents, rng=random):
+    parents = selectParents(fitnessValues, 2 * ((offspringCount + 1) // 2), rng)
+    return list(zip(parents[0::2], parents[1::2]))
+
+# counts[t] is the number of boxes of type t, every genotype holds the multiset of the box types.
+# pairs are the (first, second) indexes of the parents to cross, every pair of the population by default.
+# The children are written into the given genotypes (two for every pair) or into new arrays.
+def performCrossover(population, counts, rng=random, pairs=None, children=None):
     genotype_len = len(population[0])
-    for parents in list(itertools.combinations(population, 2)):
+    if (pairs is None):
+        pairs = itertools.combinations(range(len(population)), 2)
+    if (children is None):
+        pairs = list(pairs)
+        children = [copyGenotype(population[0]) for i in range(2 * len(pairs))]
+    # Scratch list of the repair of every child.
+    needed = list(counts)
+    k = 0
+    for first, second in pairs:
+        parents = (population[first], population[second])
         ## Randomly choose two loci to split the genotype.
         # The locus means: split BEFORE the gene with this number.
         # First locus can be the position before any gene.
         # Second locus can be any position from locus_1 + 1 to AFTER the last gene.
-        locus_1 = random.randint(0, genotype_len-1)
-        locus_2 = random.randint(locus_1+1, genotype_len)
-
-        twins = [[], []]
-        boxes_missing_in_twin = [list(parents[0]), list(parents[1])] # Lists of boxes which didn't appear in the child yet.
-        shift = 0
-        for i in range(genotype_len):
-            if (i < locus_1 or i >= locus_2): shift = 0
-            else: shift = 1
-            for j in range(2):
-                box = parents[(j + shift) % 2][i]
-                if (box in boxes_missing_in_twin[j]):
-                    # This box hasn't appeared in this child yet - insert it into the child.
-                    boxes_missing_in_twin[j].remove(box)
-                    twins[j].append(box)
-                else:
-                    # This box has already appeared in the child - insert a box that has not.
-                    twins[j].append(boxes_missing_in_twin[j].pop(0))
-        assert (not boxes_missing_in_twin[0])
-        assert (not boxes_missing_in_twin[1])
-        for t in twins:
-            children.append(t)
-
-    return children
-
-def performMutation(children, mutationProbability):
+        locus_1 = rng.randint(0, genotype_len-1)
+        locus_2 = rng.randint(locus_1+1, genotype_len)
+
+        crossTwin(parents[0], parents[1], locus_1, locus_2, counts, children[k], needed)
+        crossTwin(parents[1], parents[0], locus_1, locus_2, counts, children[k+1], needed)
+        k += 2
+
+    return children[:k]
+
+# Writes the child of the parents into child. needed is a list of the length of counts, overwritten.
+def crossTwin(parent, other_parent, locus_1, locus_2, counts, child, needed):
+    # The child gets the genes between the loci from the other parent and the rest from its parent.
+    child[:] = parent
+    child[locus_1:locus_2] = other_parent[locus_1:locus_2]
+
+    # Occurrences of a type over its count in the child are replaced, in order, by the missing ones,
+    # taken in the order they have in the parent.
+    needed[:] = counts
+    repeated = []
+    for i, gene in enumerate(child):
+        if (needed[gene]): needed[gene] -= 1
+        else: repeated.append(i)
+    if (repeated):
+        repeated = iter(repeated)
+        for gene in parent:
+            if (needed[gene]):
+                needed[gene] -= 1
+                child[next(repeated)] = gene
+
+    return child
+
+def performMutation(children, mutationProbability, rng=random):
+    # Every gene is swapped with its mirror gene with mutationProbability.
+    # Instead of a random test for every gene, the distance to the next mutated gene
+    # is drawn from the geometric distribution.
     mutationCount = 0
-    rand_max = (int)(1/mutationProbability)
-    print("Trying to mutate... ", end = '')
+    if (mutationProbability <= 0): return mutationCount
+    log_q = math.log(1 - mutationProbability) if mutationProbability < 1 else None
     for child in children:
-        for i in range(len(child)):
-            if (random.randint(1, rand_max) < 2):
-                mutationCount += 1
-                temp = child[i]
-                child[i] = child[len(child)-1-i]
-                child[len(child)-1-i] = temp
-
-    print("Mutated ", str(mutationCount), " times among ", str(len(children)), " children.")
-
-
-def chooseNewPopulation(population, children, populationSize, magazine):
-    # Calculate fitness values for all genotypes 
-    genotypesWithFitnessValues = pairGenotypesWithFitnessValues(population + children, magazine)
-    # Sort genotypes descending by their fitness value
-    genotypesWithFitnessValues.sort(key=lambda x: x[1], reverse=True)
-    print("{:.6f}".format(genotypesWithFitnessValues[0][1]))
-    # Get the list of the genotypes from the list of pairs
-    unzipped = zip(*genotypesWithFitnessValues)
-    new_population = list(list(unzipped)[0])
-    # Truncate the new population to the populationSize size
-    del new_population[populationSize:]
-    
-    return new_population
-
-def pairGenotypesWithFitnessValues(population, magazine):
-    result = []
-    for p in population:
-        for box in p:
-            magazine.addBox(box)
-        result.append((p, magazine.fill_factor))
-        magazine.removeAllBoxes()
-
-    return result
+        genotype_len = len(child)
+        i = -1
+        while (True):
+            i += 1
+            if (log_q is not None): i += (int)(math.log(1.0 - rng.random()) / log_q)
+            if (i >= genotype_len): break
+            mutationCount += 1
+            child[i], child[genotype_len-1-i] = child[genotype_len-1-i], child[i]
+
+    return mutationCount
+
+# candidates are the rows of the population - the first parentsCount ones - and of the children,
+# fitness[r] is the fitness value of the row r. Returns the rows of the new population sorted by fitness,
+# picked out without sorting all the candidates.
+def chooseNewPopulation(candidates, fitness, populationSize, elitism=None, parentsCount=0):
+    key = fitness.__getitem__
+    if (elitism is None):
+        # The best genotypes survive, whether parents or children.
+        return heapq.nlargest(populationSize, candidates, key=key)
+
+    # The elitism best parents and the best children survive. If there are not enough children,
+    # the next best parents fill up the population.
+    parents = sorted(candidates[:parentsCount], key=key, reverse=True)
+    elite = min(elitism, populationSize)
+    survivors = parents[:elite]
+    survivors += heapq.nlargest(populationSize - elite, candidates[parentsCount:], key=key)
+    survivors += parents[elite:elite + populationSize - len(survivors)]
+    survivors.sort(key=key, reverse=True)
+    return survivors
+
+class FitnessFunction:
+    # Calculates fitness values of genotypes. They are looked up in the cache first,
+    # the rest is decoded in the magazine, or by the evaluator if there is one.
+    def __init__(self, magazine, boxes, fitnessCache=None, evaluator=None):
+        self.magazine = magazine
+        self.boxes = boxes
+        self.fitness_cache = fitnessCache
+        self.evaluator = evaluator
+        self.evaluations = 0   # fitness values requested
+        self.decodes = 0       # genotypes actually decoded
+
+    def __call__(self, population):
+        fitness_values = [None] * len(population)
+        # Genotypes not found in the cache, grouped by their key so equal genotypes are decoded once.
+        to_decode = OrderedDict()
+        for i, p in enumerate(population):
+            if (self.fitness_cache is None):
+                to_decode[i] = [i]
+                continue
+            key = genotypeKey(p)
+            if (key in to_decode):
+                self.fitness_cache.hits += 1
+                to_decode[key].append(i)
+                continue
+            fitness_values[i] = self.fitness_cache.get(key)
+            if (fitness_values[i] is None):
+                to_decode[key] = [i]
+
+        genotypes = [population[indexes[0]] for indexes in to_decode.values()]
+        if (self.evaluator is None):
+            decoded = [decodeGenotype(g, self.magazine, self.boxes) for g in genotypes]
+        else:
+            decoded = self.evaluator.evaluate(genotypes)
+
+        for (key, indexes), fitness in zip(to_decode.items(), decoded):
+            if (self.fitness_cache is not None):
+                self.fitness_cache.put(key, fitness)
+            for i in indexes:
+                fitness_values[i] = fitness
+
+        self.evaluations += len(population)
+        self.decodes += len(genotypes)
+        return fitness_values
+
+    # Put the fitness value of a genotype decoded elsewhere into the cache.
+    def remember(self, genotype, fitness):
+        if (self.fitness_cache is not None):
+            self.fitness_cache.put(genotypeKey(genotype), fitness)
+
+    def cacheHits(self):
+        return self.fitness_cache.hits if self.fitness_cache is not None else 0
+
+    def close(self):
+        if (isinstance(self.evaluator, ParallelEvaluator)): self.evaluator.close()
 
+def decodeGenotype(genotype, magazine, boxes):
+    # Put the boxes into the magazine in the genotype order, the fill factor is the fitness value.
+    for i in genotype:
+        magazine.addBox(boxes[i])
+    fitness = magazine.fill_factor
+    magazine.removeAllBoxes()
 
+    return fitness
@@ -0,0 +1,125 @@
+"""
+batch.py
+Lockstep decoding of a whole population. The forbidden fields of every genotype
+are stacked in one (P, Y, X) NumPy array and the i-th box of every genotype
+is placed at once: the first fitting position of every genotype is found
+with the same array operations, whatever the sizes of their boxes.
+The next box starting points and the fill factors are kept in vectors.
+Follows exactly the same placement rules as magazine.Magazine.
+"""
+import numpy as np
+from bitmap import BitmapWallMap
+
+# Fields of the stacked grids decoded at once, larger populations are decoded in chunks.
+MAX_BATCH_FIELDS = 1 << 24
+
+class BatchEvaluator:
+    def __init__(self, magazine, boxes):
+        self.X = magazine.X
+        self.Y = magazine.Y
+        self.free_fields = self.X*self.Y - magazine.wall_blocks_count
+        # 1 for every wall, in the order of the fields - the forbidden fields of an empty magazine.
+        self.walls = np.frombuffer(magazine.getWalls(), dtype=np.uint8).reshape(self.Y, self.X)
+        self.wall_map = BitmapWallMap(self.walls)
+        self.len_x = np.array([b.len_x for b in boxes], dtype=np.int64)
+        self.len_y = np.array([b.len_y for b in boxes], dtype=np.int64)
+        self.chunk_size = max(1, MAX_BATCH_FIELDS // max(self.X*self.Y, 1))
+
+    def evaluate(self, genotypes):
+        if (not genotypes): return []
+        result = []
+        for i in range(0, len(genotypes), self.chunk_size):
+            chunk = np.array(genotypes[i:i+self.chunk_size], dtype=np.int64)
+            result.extend(self.decode(chunk).tolist())
+        return result
+
+    # Fill factors of the genotypes - rows of the 2D array of box indexes.
+    def decode(self, genotypes):
+        P, genotype_len = genotypes.shape
+        X, Y = self.X, self.Y
+        fill_factors = np.zeros(P)
+        if (self.free_fields <= 0 or genotype_len == 0): return fill_factors
+
+        # forbidden[p] - the fields no box field of the genotype p can be put in:
+        # walls, boxes and the fields on the left, right and below the boxes and in their two lower corners.
+        forbidden = np.empty((P, Y, X), dtype=np.uint8)
+        forbidden[:] = self.walls
+        next_box_index = np.zeros(P, dtype=np.int64)
+        rows = np.arange(P)
+
+        for column in genotypes.T:
+            position = self.__findPositions(forbidden, next_box_index, column)
+            placed = position >= 0
+            if (not placed.any()): continue
+
+            p = rows[placed]
+            w = self.len_x[column[placed]]
+            h = self.len_y[column[placed]]
+            y, x = np.divmod(position[placed], X)
+            self.__markBoxes(forbidden, p, x, y, w, h)
+            fill_factors[p] += (w*h) / self.free_fields
+            next_box_index[p] = position[placed] + w + 1
+
+        return fill_factors
+
+    # Index of the first field, not before the starting point, where the box of every genotype
+    # (boxes[column[p]] for the genotype p) has no forbidden field, or -1.
+    def __findPositions(self, forbidden, start, column):
+        X, Y = self.X, self.Y
+        positions = np.full(start.size, -1, dtype=np.int64)
+        # Genotypes putting boxes of the same size are searched together, with the same window.
+        # Positions after the last one without walls under the box are never checked.
+        types, genotypes = np.unique(column, return_inverse=True)
+        for i, t in enumerate(types.tolist()):
+            w = int(self.len_x[t])
+            h = int(self.len_y[t])
+            searched = np.flatnonzero((genotypes == i) & (start <= self.wall_map.lastStart(w, h)))
+            if (searched.size == 0): continue
+            start_y, start_x = np.divmod(start[searched], X)
+            # As in bitmap.BitmapMagazine the positions are searched in bands of rows, starting with
+            # a band just below the starting point and doubling it for the genotypes with nothing found.
+            band = 2*h + 8
+            while (searched.size > 0):
+                band = min(band, Y)
+                found = self.__findInBand(forbidden, searched, start_y, start_x, w, h, band)
+                positions[searched] = found
+                # Not found and the band doesn't reach the last row - the next band begins
+                # with the first row of positions not checked yet.
+                again = (found < 0) & (start_y + band < Y)
+                searched = searched[again]
+                start_y = start_y[again] + band - h + 1
+                start_x = np.zeros(searched.size, dtype=np.int64)
+                band *= 2
+        return positions
+
+    def __findInBand(self, forbidden, p, start_y, start_x, w, h, band):
+        X, Y = self.X, self.Y
+        # The rows of the band of every genotype, rows below the magazine are forbidden.
+        row_indexes = start_y[:, None] + np.arange(band)[None, :]
+        rows = forbidden[p[:, None], np.minimum(row_indexes, Y - 1)]
+        rows[row_indexes >= Y] = 1
+
+        # Summed-area tables of the rows, so the number of forbidden fields under the box
+        # is known for every position at once.
+        sat = np.zeros((p.size, band + 1, X + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(rows, axis=1, dtype=np.int32), axis=2, out=sat[:, 1:, 1:])
+        conflicts = sat[:, h:, w:] - sat[:, :-h, w:] - sat[:, h:, :-w] + sat[:, :-h, :-w]
+
+        # conflicts[i, r, c] is for the box with the upper-left corner in (c, start_y[i] + r).
+        # Positions before the starting point are not taken into account.
+        fits = (conflicts == 0)
+        fits[:, 0, :] &= np.arange(X - w + 1)[None, :] >= start_x[:, None]
+        fits = fits.reshape(p.size, -1)
+        position = fits.argmax(axis=1)
+        row, x = np.divmod(position, X - w + 1)
+        return np.where(fits[np.arange(p.size), position], (start_y + row)*X + x, -1)
+
+    def __markBoxes(self, forbidden, p, x, y, w, h):
+        # The box fields and the fields on their left, right and below, for boxes of different sizes at once.
+        # Offsets beyond the size of a box and fields out of the magazine are moved to its edge fields,
+        # which are marked anyway.
+        row_offsets = np.arange(int(h.max()) + 1)[None, :]
+        column_offsets = np.arange(int(w.max()) + 2)[None, :]
+        ys = np.minimum(y[:, None] + np.minimum(row_offsets, h[:, None]), self.Y - 1)
+        xs = np.clip(x[:, None] - 1 + np.minimum(column_offsets, w[:, None] + 1), 0, self.X - 1)
+        forbidden[p[:, None, None], ys[:, :, None], xs[:, None, :]] = 1
@@ -0,0 +1,173 @@
+"""
+benchmark.py
+Reproducible benchmarks of the decoder (Magazine.addBox) and of the genetic algorithm loop.
+Instances are generated from a seed: open rectangles and wall-heavy irregular magazines,
+filled with many small boxes or a few large ones, at grid sizes from 8x8 to 512x512.
+For every instance and magazine engine it measures decodes per second, generations
+per second, peak memory and the fill factor reached within the time budget.
+Every case runs in a fresh process, so its peak memory is not affected by the other cases.
+Results are written to a JSON file; --compare prints the ratios between two such files.
+
+Usage: python3 ./src/benchmark.py [--sizes 8 32 128 512] [--budget 2] [--out bench.json]
+       python3 ./src/benchmark.py --compare old.json new.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from solver import *
+
+KINDS = ("open", "irregular")
+BOX_MIXES = ("small", "large")
+
+def generateMagazineShape(kind, size, rng):
+    shape = [["empty"] * size for x in range(size)]
+    if (kind == "irregular"):
+        # Random wall blocks covering about a third of the magazine, the upper-left field stays empty.
+        walls = 0
+        while (walls < size*size // 3):
+            len_x = rng.randint(1, max(1, size // 4))
+            len_y = rng.randint(1, max(1, size // 4))
+            x = rng.randint(0, size - len_x)
+            y = rng.randint(0, size - len_y)
+            for i in range(x, x + len_x):
+                for j in range(y, y + len_y):
+                    if (shape[i][j] == "empty" and (i, j) != (0, 0)):
+                        shape[i][j] = "wall"
+                        walls += 1
+    return shape
+
+def generateBoxes(mix, size, rng):
+    if (mix == "small"):
+        count = min(max(size, 8), 256)
+        max_len = max(2, size // 8)
+        return [(rng.randint(1, max_len), rng.randint(1, max_len)) for i in range(count)]
+    else:
+        return [(rng.randint(max(1, size // 6), max(2, size // 3)), rng.randint(max(1, size // 6), max(2, size // 3)))
+                for i in range(6)]
+
+def createMagazine(engine, shape):
+    magazine = getMagazineEngine(engine)(len(shape), len(shape[0]))
+    for x in range(len(shape)):
+        for y in range(len(shape[0])):
+            if (shape[x][y] == "wall"):
+                magazine.setFieldStateToWall(x, y)
+    return magazine
+
+def measureDecodes(magazine, boxes, budget, rng):
+    genotype = list(range(len(boxes)))
+    decodes = 0
+    start = time.perf_counter()
+    while (True):
+        rng.shuffle(genotype)
+        decodeGenotype(genotype, magazine, boxes)
+        decodes += 1
+        elapsed = time.perf_counter() - start
+        if (elapsed >= budget): break
+    return decodes / elapsed
+
+def runAlgorithm(magazine, boxes, iterations, stopEvent=None):
+    stats = {}
+    best = [0.0]
+    def progress(generation, best_fitness, mean, evaluationsPerSecond, genotype):
+        best[0] = best_fitness
+    performAlgorithm(magazine, boxes, DEFAULT_POPULATION_SIZE, iterations, DEFAULT_MUTATION_PROBABILITY,
+                     FitnessCache(4096), stats=stats, progressCallback=progress, stopEvent=stopEvent,
+                     stopAtUpperBound=False)
+    return (stats["generations"], best[0])
+
+def measureAlgorithm(magazine, boxes, budget):
+    stop_event = threading.Event()
+    timer = threading.Timer(budget, stop_event.set)
+    start = time.perf_counter()
+    timer.start()
+    try:
+        generations, best = runAlgorithm(magazine, boxes, sys.maxsize, stop_event)
+    finally:
+        timer.cancel()
+    return (generations / (time.perf_counter() - start), best)
+
+def getPeakMemory():
+    # Peak resident set size of this process in bytes (ru_maxrss is in kilobytes on Linux, bytes on macOS).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def runCase(kind, mix, size, engine, budget, seed):
+    # Every instance depends only on the seed and its parameters, not on the other cases.
+    case_seed = "{}-{}-{}-{}".format(seed, kind, mix, size)
+    rng = random.Random(case_seed)
+    shape = generateMagazineShape(kind, size, rng)
+    boxes = [Box(len_x, len_y) for len_x, len_y in generateBoxes(mix, size, rng)]
+
+    magazine = createMagazine(engine, shape)
+    decodes_per_second = measureDecodes(magazine, boxes, budget, random.Random(case_seed))
+    random.seed(case_seed)
+    generations_per_second, fill_factor = measureAlgorithm(magazine, boxes, budget)
+
+    return {
+        "kind": kind, "boxes": mix, "size": size, "engine": engine,
+        "box_count": len(boxes), "wall_count": magazine.wall_blocks_count,
+        "decodes_per_second": decodes_per_second,
+        "generations_per_second": generations_per_second,
+        "fill_factor": fill_factor,
+        "peak_memory_bytes": getPeakMemory(),
+    }
+
+def caseName(result):
+    return "{kind}/{boxes}/{size}/{engine}".format(**result)
+
+def compareResults(old_path, new_path):
+    with open(old_path) as f: old = {caseName(r): r for r in json.load(f)["results"]}
+    with open(new_path) as f: new = {caseName(r): r for r in json.load(f)["results"]}
+    metrics = ("decodes_per_second", "generations_per_second", "fill_factor", "peak_memory_bytes")
+    print("{:32}".format("case") + "".join("{:>24}".format(m) for m in metrics))
+    for name in sorted(old.keys() & new.keys()):
+        ratios = []
+        for m in metrics:
+            ratios.append("{:>24}".format("{:.3f}x".format(new[name][m] / old[name][m]) if old[name][m] else "-"))
+        print("{:32}".format(name) + "".join(ratios))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the decoder and the genetic algorithm.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 32, 128, 512])
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    parser.add_argument("--boxes", nargs="+", default=list(BOX_MIXES), choices=BOX_MIXES)
+    parser.add_argument("--engines", nargs="+", default=["fields", "bitmap"])
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if (args.compare):
+        compareResults(*args.compare)
+        return 0
+
+    results = []
+    for kind in args.kinds:
+        for mix in args.boxes:
+            for size in args.sizes:
+                for engine in args.engines:
+                    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                        result = pool.apply(runCase, (kind, mix, size, engine, args.budget, args.seed))
+                    print("{:32} {:12.1f} decodes/s {:10.2f} gen/s  fill {:.4f}".format(
+                        caseName(result), result["decodes_per_second"], result["generations_per_second"],
+                        result["fill_factor"]), file=sys.stderr)
+                    results.append(result)
+
+    report = {
+        "meta": {"seed": args.seed, "budget": args.budget, "python": platform.python_version(),
+                 "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+bitmap.py
+Alternative magazine engine. The grid is kept in a 2D uint8 NumPy array
+and the search for a box position is done with array operations
+instead of checking the fields one by one.
+Follows exactly the same placement rules as magazine.Magazine.
+"""
+import numpy as np
+from magazine import *
+
+# Magazines with more fields than this per inserted box have the boxes removed box by box, smaller ones
+# all at once with array operations on the whole grid, which is faster then.
+LOCAL_UPDATE_FIELDS = 8192
+
+class BitmapWallMap:
+    # NumPy version of magazine.WallMap: the integral image of the walls
+    # and the last wall-free starting field for every box size.
+    def __init__(self, walls):
+        self.Y, self.X = walls.shape
+        # 32 bit counts are enough for magazines of up to 2^31 fields and take half of the memory.
+        dtype = np.int32 if walls.size < 1 << 31 else np.int64
+        self.sat = np.zeros((self.Y + 1, self.X + 1), dtype=dtype)
+        # Summed in place in the whole table, without temporary arrays of its size.
+        self.sat[1:, 1:] = walls
+        np.cumsum(self.sat, axis=0, out=self.sat)
+        np.cumsum(self.sat, axis=1, out=self.sat)
+        self.last_starts = {}
+
+    def lastStart(self, len_x, len_y):
+        key = (len_x, len_y)
+        if (key not in self.last_starts):
+            self.last_starts[key] = -1
+            if (len_x <= self.X and len_y <= self.Y):
+                # The rows of the starting positions are searched from the bottom in bands, doubling them
+                # while nothing is found, so the whole magazine is gone through only if walls fill its bottom.
+                sat = self.sat
+                end = self.Y - len_y + 1
+                band = 8
+                while (end > 0):
+                    start = max(end - band, 0)
+                    walls = (sat[start+len_y:end+len_y, len_x:] - sat[start:end, len_x:]
+                             - sat[start+len_y:end+len_y, :-len_x] + sat[start:end, :-len_x])
+                    starts = np.flatnonzero(walls == 0)
+                    if (starts.size > 0):
+                        y, x = divmod(int(starts[-1]), walls.shape[1])
+                        self.last_starts[key] = x + (start + y)*self.X
+                        break
+                    end = start
+                    band *= 2
+        return self.last_starts[key]
+
+class BitmapMagazine:
+    def __init__(self, X, Y):
+        self.X = X
+        self.Y = Y
+        self.fill_factor = 0.0
+        self.wall_blocks_count = 0
+        self.next_box_index = 0   # index of field where trying to insert a next box will begin
+        self.placed_boxes = []    # (start index, len_x, len_y) of the boxes inserted so far
+        # Work of the position search, for profiling: addBox calls, bands of rows searched
+        # and positions checked for conflicts in them.
+        self.add_box_calls = 0
+        self.scan_steps = 0
+        self.conflict_checks = 0
+
+        # grid[y, x] holds the FieldState value of the (x, y) field, so the row-major
+        # order of the array is the order of the fields in magazine.Magazine.
+        self.grid = np.full((Y, X), FieldState.EMPTY.value, dtype=np.uint8)
+        # 1 for every field no box field can be put in: walls, boxes and the fields
+        # conflicting with boxes (left, right, below and two lower corners of a box field).
+        self.forbidden = np.zeros((Y, X), dtype=np.uint8)
+        # Calculated before the first box is inserted after changing walls.
+        self.wall_map = None
+
+    def setFieldStateToWall(self, x, y):
+        self.__setFieldState(x, y, FieldState.WALL)
+        self.wall_blocks_count += 1
+
+    def setFieldStateToEmpty(self, x, y):
+        if (self.__setFieldState(x, y, FieldState.EMPTY) == FieldState.WALL):
+            self.wall_blocks_count -= 1
+
+    def __setFieldState(self, x, y, state):
+        assert (0 <= x < self.X)
+        assert (0 <= y < self.Y)
+        oldstate = FieldState(self.grid[y, x])
+        self.grid[y, x] = state.value
+        if (FieldState.WALL in (oldstate, state)):
+            self.wall_map = None
+        self.forbidden[y, x] = (state != FieldState.EMPTY) or self.__isNextToBox(x, y)
+        return oldstate
+
+    # Set all the walls at once from the (Y, X) bool array, the other fields become empty.
+    def setWalls(self, walls):
+        self.removeAllBoxes()
+        self.grid[:] = FieldState.EMPTY.value
+        self.grid[walls] = FieldState.WALL.value
+        self.forbidden[:] = walls
+        self.wall_blocks_count = int(np.count_nonzero(walls))
+        self.wall_map = None
+
+    # One byte for every field, in the order of the field indexes: 1 for a wall, 0 otherwise.
+    def getWalls(self):
+        return (self.grid == FieldState.WALL.value).astype(np.uint8).tobytes()
+
+    def __isNextToBox(self, x, y):
+        around = self.grid[max(y-1, 0):y+1, max(x-1, 0):x+2]
+        return bool((around == FieldState.BOX.value).any())
+
+    def getFieldState(self, x, y):
+        assert (0 <= x < self.X)
+        assert (0 <= y < self.Y)
+
+        state = self.grid[y, x]
+        if state == FieldState.EMPTY.value: return "empty"
+        elif state == FieldState.WALL.value: return "wall"
+        elif state == FieldState.BOX.value: return "box"
+        assert (False)
+
+    def addBox(self, box):
+        if (self.wall_map is None):
+            self.wall_map = BitmapWallMap(self.grid == FieldState.WALL.value)
+        self.add_box_calls += 1
+        # Positions after the last one without walls under the box are never checked.
+        last_start = self.wall_map.lastStart(box.len_x, box.len_y)
+        if (self.next_box_index > last_start):
+            # The box won't fit
+            return False
+        start_y = self.next_box_index // self.X
+        start_x = self.next_box_index - start_y*self.X
+
+        # The positions are searched in bands of rows, starting with a band just below the
+        # starting point and doubling it while nothing is found, so the work done for a box
+        # which fits near the starting point does not depend on the magazine size.
+        h = box.len_y
+        w = box.len_x
+        last_y = last_start // self.X + h
+        band = 2*h + 8
+        while (True):
+            end_y = min(start_y + band, last_y)
+            found = self.__findPosition(start_y, end_y, start_x, w, h)
+            self.scan_steps += 1
+            if (found is not None or end_y == last_y):
+                break
+            # The next band begins with the first row of positions not checked yet.
+            start_y = end_y - h + 1
+            start_x = 0
+            band *= 2
+        if (found is None):
+            return False
+        x, y = found
+
+        # Insert the box and mark the fields it makes forbidden
+        self.__markBox(x + y*self.X, w, h)
+        # Update fill factor
+        self.fill_factor += (w*h)/(self.X*self.Y - self.wall_blocks_count)
+        # Move the next box starting point
+        self.next_box_index = x + y*self.X + w + 1
+        self.placed_boxes.append((x + y*self.X, w, h))
+
+        return True
+
+    # First position (x, y) in row-major order, with start_y <= y and y + h <= end_y and not before
+    # (start_x, start_y), where the box has no forbidden field, or None.
+    def __findPosition(self, start_y, end_y, start_x, w, h):
+        # Summed-area table of the forbidden fields of the rows,
+        # so the number of forbidden fields under the box is known for every position at once.
+        rows = self.forbidden[start_y:end_y]
+        sat = np.zeros((rows.shape[0] + 1, self.X + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(rows, axis=0, dtype=np.int32), axis=1, out=sat[1:, 1:])
+        conflicts = sat[h:, w:] - sat[:-h, w:] - sat[h:, :-w] + sat[:-h, :-w]
+        self.conflict_checks += conflicts.size
+
+        # conflicts[r, c] is for the box with the upper-left corner in (c, start_y + r).
+        # Positions before the starting point are not taken into account.
+        fits = (conflicts == 0)
+        fits[0, :start_x] = False
+        positions = np.flatnonzero(fits)
+        if (positions.size == 0):
+            return None
+
+        row, x = divmod(int(positions[0]), fits.shape[1])
+        return (x, start_y + row)
+
+    def __markBox(self, start_index, w, h):
+        y, x = divmod(start_index, self.X)
+        self.grid[y:y+h, x:x+w] = FieldState.BOX.value
+        self.forbidden[y:y+h+1, max(x-1, 0):x+w+1] = 1
+
+    def removeAllBoxes(self):
+        if (self.grid.size > LOCAL_UPDATE_FIELDS*len(self.placed_boxes)):
+            self.__removeBoxes()
+        else:
+            self.grid[self.grid == FieldState.BOX.value] = FieldState.EMPTY.value
+            self.forbidden[:] = (self.grid == FieldState.WALL.value)
+        self.fill_factor = 0.0
+        self.next_box_index = 0
+        self.placed_boxes = []
+
+    def __removeBoxes(self):
+        # Only the fields of the inserted boxes and the fields they made forbidden are touched.
+        for start_index, w, h in self.placed_boxes:
+            y, x = divmod(start_index, self.X)
+            self.grid[y:y+h, x:x+w] = FieldState.EMPTY.value
+        # With no boxes left the forbidden fields are the walls.
+        for start_index, w, h in self.placed_boxes:
+            y, x = divmod(start_index, self.X)
+            region = (slice(y, y+h+1), slice(max(x-1, 0), x+w+1))
+            self.forbidden[region] = (self.grid[region] == FieldState.WALL.value)
+
+    def __unmarkBoxes(self, boxes):
+        # Removes the boxes (start index, w, h) and recalculates the forbidden fields around them
+        # from the walls and the boxes left.
+        regions = []
+        for start_index, w, h in boxes:
+            y, x = divmod(start_index, self.X)
+            self.grid[y:y+h, x:x+w] = FieldState.EMPTY.value
+            regions.append((y, min(y+h+1, self.Y), max(x-1, 0), min(x+w+1, self.X)))
+        for region in regions:
+            self.__updateForbidden(*region)
+
+    def __updateForbidden(self, from_y, to_y, from_x, to_x):
+        # Forbidden fields of the rows from_y to to_y and the columns from_x to to_x (exclusive):
+        # walls, boxes and the fields with a box field on the left, right, above or in an upper corner.
+        grid = self.grid
+        box = np.zeros((to_y - from_y + 1, to_x - from_x + 2), dtype=bool)
+        top = max(from_y - 1, 0)
+        left = max(from_x - 1, 0)
+        right = min(to_x + 1, self.X)
+        # box[r, c] tells if the field (from_x - 1 + c, from_y - 1 + r) is a box field.
+        box[top - from_y + 1:, left - from_x + 1:right - from_x + 1] = (grid[top:to_y, left:right]
+                                                                         == FieldState.BOX.value)
+        near_box = (box[1:, :-2] | box[1:, 2:] | box[:-1, :-2] | box[:-1, 1:-1] | box[:-1, 2:])
+        self.forbidden[from_y:to_y, from_x:to_x] = ((grid[from_y:to_y, from_x:to_x] != FieldState.EMPTY.value)
+                                                     | near_box)
+
+    # The state of the inserted boxes, which can be brought back by restoreState().
+    def saveState(self):
+        return (self.fill_factor, self.next_box_index, tuple(self.placed_boxes))
+
+    def restoreState(self, state):
+        # Only the fields of the boxes inserted now and in the saved state are changed.
+        # If the saved boxes are the first ones inserted now, only the boxes inserted after them are removed.
+        # In small magazines going through all the fields is faster than going box by box.
+        saved_count = len(state[2])
+        if (self.grid.size > LOCAL_UPDATE_FIELDS*len(self.placed_boxes) and saved_count <= len(self.placed_boxes)
+                and tuple(self.placed_boxes[:saved_count]) == state[2]):
+            self.__unmarkBoxes(self.placed_boxes[saved_count:])
+            self.fill_factor, self.next_box_index = state[0], state[1]
+            del self.placed_boxes[saved_count:]
+            return
+        self.removeAllBoxes()
+        self.fill_factor, self.next_box_index, placed_boxes = state
+        self.placed_boxes = list(placed_boxes)
+        for placed in self.placed_boxes:
+            self.__markBox(*placed)
@@ -0,0 +1,84 @@
+"""
+checkpoint.py
+Checkpoints of the genetic algorithm run. A checkpoint holds the instance (magazine walls,
+boxes and the algorithm parameters), the population (arrays of box type ids), the generation
+counter and the states of the random number generators and of the stopping criteria, so a run resumed from it
+(see Solver.resume) continues exactly as the interrupted run would have.
+The file is a short header followed by the zlib compressed pickle of the checkpoint dict;
+the walls are one byte per field and the genotypes one flat array of 16 or 32 bit integers.
+Checkpoints are pickles - load only the files written by this program.
+"""
+import array
+import itertools
+import os
+import pickle
+import zlib
+
+MAGIC = b"MAGCKPT\x01"
+
+def saveCheckpoint(path, checkpoint):
+    data = MAGIC + zlib.compress(pickle.dumps(checkpoint, pickle.HIGHEST_PROTOCOL))
+    # Written to a temporary file first, so a crash while writing leaves the previous checkpoint intact.
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def loadCheckpoint(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if (not data.startswith(MAGIC)):
+        raise ValueError("Not a checkpoint file: " + str(path))
+    return pickle.loads(zlib.decompress(data[len(MAGIC):]))
+
+def packGenotypes(population):
+    genes = array.array(population[0].typecode if isinstance(population[0], array.array) else population[0].format)
+    for genotype in population:
+        genes.extend(genotype)
+    return genes
+
+def unpackGenotypes(genes, genotypeLength, typecode):
+    return [array.array(typecode, genes[i:i+genotypeLength]) for i in range(0, len(genes), genotypeLength)]
+
+# Magazine shape (shape[x][y] is "wall" or "empty") and box dimensions of the checkpointed instance,
+# in the form taken by Solver.solve. Runs started from a layout give a layout (see layout.py) instead of the shape.
+def getCheckpointInstance(checkpoint):
+    X, Y, walls = checkpoint["width"], checkpoint["height"], checkpoint["walls"]
+    if (checkpoint.get("layout")):
+        from layout import getLayoutFromWalls
+        shape = getLayoutFromWalls(walls, X, Y)
+    else:
+        shape = [["wall" if walls[x + y*X] else "empty" for y in range(Y)] for x in range(X)]
+    dimensions = checkpoint["boxes"]
+    boxes = [(dimensions[i], dimensions[i+1]) for i in range(0, len(dimensions), 2)]
+    return (shape, boxes)
+
+class Checkpointer:
+    # Saves a checkpoint of the run to path every interval generations and at the end of the run.
+    def __init__(self, path, interval, magazine, boxes, populationSize, iterations, mutationProbability,
+                 batchOperators, offspringCount=None, parentSelection="tournament", elitism=None, localSearch=0,
+                 localSearchMoves=32, layout=False):
+        self.path = path
+        self.interval = max(1, interval)
+        self.saved_generation = None
+
+        self.instance = {
+            "width": magazine.X, "height": magazine.Y, "walls": magazine.getWalls(),
+            "boxes": array.array("L", itertools.chain.from_iterable((b.len_x, b.len_y) for b in boxes)),
+            "population_size": populationSize, "iterations": iterations,
+            "mutation_probability": mutationProbability, "batch_operators": batchOperators,
+            "offspring_count": offspringCount, "parent_selection": parentSelection, "elitism": elitism,
+            "local_search": localSearch, "local_search_moves": localSearchMoves,
+            "layout": layout,   # the magazine was given as a layout
+        }
+
+    # batchRng is the NumPy generator of the batch operators, None without them.
+    def save(self, generation, population, rng, batchRng, stopping):
+        if (generation == self.saved_generation): return
+        saveCheckpoint(self.path, dict(
+            self.instance, generation=generation, population=packGenotypes(population),
+            rng_state=rng.getstate(), batch_rng_state=batchRng.bit_generator.state if batchRng is not None else None,
+            best=stopping.best, stalled=stopping.stalled))
+        self.saved_generation = generation
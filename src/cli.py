@@ -0,0 +1,161 @@
+"""
+cli.py
+Headless batch mode of the 'Magazine' project. Reads solve jobs from JSON
+files or stdin and prints one JSON result line per job as soon as it is solved.
+Does not need tkinter or a display.
+
+Usage: python3 ./src/cli.py [-j N] [--metrics FILE] [--profile DIR [--profile-format collapsed]] [jobs.json ...]
+(no files or "-" read stdin)
+With --metrics the metrics of every generation of every job are appended to FILE as JSON lines.
+With --profile every job is profiled into DIR/<job id>.pstats, or DIR/<job id>.folded with collapsed stacks
+(see profiling.py); "profile" in its result holds the counters of the box position search.
+
+A job file holds one job object, a JSON array of jobs or one job per line:
+{
+    "id": "order-1",                      (optional, the job number by default)
+    "magazine": ["....#", "#...."],       (rows from the top, "#" is a wall)
+      or {"width": 8, "height": 8, "walls": [[x, y], ...]},
+      or {"file": "floor.pgm"}            (text bitmap or PGM file, see layout.py)
+    "boxes": [[2, 3], [1, 1]],            (width, height of every box)
+    "populationSize": 7, "iterations": 20, "mutationProbability": 0.033,   (optional)
+    "options": {"engine": "bitmap", "workers": 4},  (optional, passed to Solver.solve)
+    "output": "result.pgm"                (optional, the solution is saved there, see layout.py)
+}
+Options such as "stallGenerations", "targetFitness" and "timeBudget" stop the job early,
+"stop_reason" in its result tells why it stopped.
+With the "incremental" option "prefix_add_box_calls" and "prefix_skipped_boxes" in the result tell how many
+boxes were inserted and how many were skipped thanks to the saved magazine states (see incremental.py).
+With the "solutionCache" option (a directory, see solutioncache.py) repeated jobs are answered from the cache
+and similar ones start from the stored solutions; "solution_cache" in the result tells which.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from solver import *
+from metrics import JsonlObserver
+
+def parseJobs(text):
+    text = text.strip()
+    if (not text): return []
+    try:
+        jobs = json.loads(text)
+    except json.JSONDecodeError:
+        # One job per line
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if (isinstance(jobs, dict)): jobs = [jobs]
+    return jobs
+
+def readJobs(paths):
+    jobs = []
+    for path in (paths or ["-"]):
+        if (path == "-"):
+            jobs.extend(parseJobs(sys.stdin.read()))
+        else:
+            with open(path) as f:
+                jobs.extend(parseJobs(f.read()))
+    return jobs
+
+# Magazine shape in the form taken by Solver.solve: shape[x][y] is "wall" or "empty",
+# or a layout array for magazine files.
+def getMagazineShape(magazine):
+    if (isinstance(magazine, dict) and "file" in magazine):
+        from layout import loadLayout
+        return loadLayout(magazine["file"])
+    if (isinstance(magazine, dict)):
+        shape = [["empty"] * magazine["height"] for x in range(magazine["width"])]
+        for x, y in magazine.get("walls", []):
+            shape[x][y] = "wall"
+        return shape
+
+    width = max(len(row) for row in magazine)
+    shape = [["wall"] * len(magazine) for x in range(width)]
+    for y, row in enumerate(magazine):
+        for x, field in enumerate(row):
+            if (field != "#"): shape[x][y] = "empty"
+    return shape
+
+# Path of the profile of the job in the directory, named after the job id.
+def getProfilePath(directory, jobId, profileFormat):
+    name = re.sub(r"[^\w.-]", "_", str(jobId))
+    return os.path.join(directory, name + (".folded" if profileFormat == "collapsed" else ".pstats"))
+
+# progressCallback and stopEvent are passed to Solver.solve.
+# With a profileDir the job is profiled into that directory (see getProfilePath).
+def runJob(number, job, metricsPath=None, progressCallback=None, stopEvent=None, profileDir=None,
+           profileFormat="pstats"):
+    result = {"job": number, "id": job.get("id", number)}
+    observer = None
+    try:
+        shape = getMagazineShape(job["magazine"])
+        boxes = [tuple(b) for b in job["boxes"]]
+        solver = Solver()
+        options = dict(job.get("options", {}))
+        if (metricsPath is not None):
+            observer = options["observer"] = JsonlObserver(metricsPath, job=number, id=result["id"])
+        if (progressCallback is not None):
+            options["progressCallback"] = progressCallback
+        if (stopEvent is not None):
+            options["stopEvent"] = stopEvent
+        if (profileDir is not None):
+            options["profilePath"] = getProfilePath(profileDir, result["id"], profileFormat)
+        start = time.perf_counter()
+        solution, fill_factor = solver.solve(shape, boxes,
+                                             job.get("populationSize", DEFAULT_POPULATION_SIZE),
+                                             job.get("iterations", DEFAULT_ITERATIONS),
+                                             job.get("mutationProbability", DEFAULT_MUTATION_PROBABILITY),
+                                             **options)
+        result["time"] = time.perf_counter() - start
+        if ("output" in job):
+            from layout import saveLayout, getLayoutFromShape
+            saveLayout(job["output"], solution if not isinstance(solution, list) else getLayoutFromShape(solution))
+        result["fill_factor"] = fill_factor
+        result["placement"] = [{"box": i, "x": x, "y": y, "width": boxes[i][0], "height": boxes[i][1]}
+                               for i, x, y in solver.placement]
+        result.update(solver.stats)
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    finally:
+        # The metrics file stays open if the run failed before the end.
+        if (observer is not None): observer.close()
+    return result
+
+def writeResult(result):
+    sys.stdout.write(json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve magazine jobs without the GUI.")
+    parser.add_argument("files", nargs="*", help="job files, stdin if none or \"-\"")
+    parser.add_argument("-j", "--parallel", type=int, default=1, help="number of jobs solved at once")
+    parser.add_argument("--metrics", help="file to append the metrics of every generation to")
+    parser.add_argument("--profile", metavar="DIR", help="directory to write the profile of every job to")
+    parser.add_argument("--profile-format", choices=["pstats", "collapsed"], default="pstats",
+                        help="pstats of cProfile or sampled collapsed stacks for flame graphs")
+    args = parser.parse_args(argv)
+    if (args.profile is not None):
+        os.makedirs(args.profile, exist_ok=True)
+
+    jobs = readJobs(args.files)
+    failed = False
+    if (args.parallel <= 1):
+        for number, job in enumerate(jobs):
+            result = runJob(number, job, args.metrics, profileDir=args.profile, profileFormat=args.profile_format)
+            failed |= "error" in result
+            writeResult(result)
+    else:
+        with ProcessPoolExecutor(max_workers=args.parallel) as executor:
+            futures = [executor.submit(runJob, number, job, args.metrics, profileDir=args.profile,
+                                       profileFormat=args.profile_format) for number, job in enumerate(jobs)]
+            for future in as_completed(futures):
+                result = future.result()
+                failed |= "error" in result
+                writeResult(result)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+client.py
+Client library of the solver service (see service.py).
+
+    client = SolverClient(socketPath="/tmp/magazine.sock")   # or SolverClient(port=...)
+    result = client.solve(job, priority=1, progressCallback=print)
+    client.close()
+
+Jobs are dicts in the format of cli.py, results are the dicts printed by cli.py.
+submit() only queues a job, so many jobs can be solved at once and waited for with wait().
+The client can be used from many threads.
+"""
+import itertools
+import json
+import queue
+import socket
+import threading
+from service import DEFAULT_PORT
+
+class SolverClient:
+    def __init__(self, socketPath=None, host="127.0.0.1", port=DEFAULT_PORT):
+        if (socketPath is not None):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(socketPath)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rwb")
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.tags = itertools.count()
+        # Messages of every job, of the "queued" answers (by tag) and of the status answers.
+        self.job_messages = {}
+        self.queued = {}
+        self.status_answers = queue.Queue()
+        self.error = None
+        self.reader = threading.Thread(target=self.__readMessages, daemon=True)
+        self.reader.start()
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Queue the job and return its id.
+    def submit(self, job, priority=0):
+        answer = queue.Queue()
+        with self.lock:
+            tag = next(self.tags)
+            self.queued[tag] = answer
+        self.__send({"type": "solve", "job": job, "priority": priority, "tag": tag})
+        message = self.__get(answer)
+        if (message["type"] == "error"):
+            raise ValueError(message["message"])
+        return message["job_id"]
+
+    # Wait for the result of the job. progressCallback(message) gets its progress reports.
+    def wait(self, jobId, progressCallback=None):
+        messages = self.__getJobMessages(jobId)
+        while (True):
+            message = self.__get(messages)
+            if (message["type"] == "result"):
+                with self.lock:
+                    del self.job_messages[jobId]
+                return message
+            if (message["type"] == "progress" and progressCallback is not None):
+                progressCallback(message)
+
+    def solve(self, job, priority=0, progressCallback=None):
+        return self.wait(self.submit(job, priority), progressCallback)
+
+    def cancel(self, jobId):
+        self.__send({"type": "cancel", "job_id": jobId})
+
+    def status(self):
+        self.__send({"type": "status"})
+        return self.__get(self.status_answers)
+
+    def __send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        with self.send_lock:
+            self.file.write(data)
+            self.file.flush()
+
+    def __get(self, messages):
+        message = messages.get()
+        if (message is None):
+            raise ConnectionError("Connection to the solver service lost: " + str(self.error))
+        return message
+
+    def __getJobMessages(self, jobId):
+        with self.lock:
+            return self.job_messages.setdefault(jobId, queue.Queue())
+
+    def __readMessages(self):
+        # Runs in a thread and passes every message to the queue it is awaited on.
+        try:
+            for line in self.file:
+                message = json.loads(line)
+                kind = message["type"]
+                if (kind == "queued" or (kind == "error" and "tag" in message)):
+                    if (kind == "queued"): self.__getJobMessages(message["job_id"])
+                    with self.lock:
+                        answer = self.queued.pop(message["tag"], None)
+                    if (answer is not None): answer.put(message)
+                elif (kind == "status"):
+                    self.status_answers.put(message)
+                elif (kind == "error"):
+                    self.error = message["message"]
+                else:
+                    self.__getJobMessages(message["job_id"]).put(message)
+        except (OSError, ValueError) as e:
+            self.error = e
+        # Wake up everyone still waiting.
+        with self.lock:
+            waiting = list(self.queued.values()) + list(self.job_messages.values())
+        for messages in waiting + [self.status_answers]:
+            messages.put(None)
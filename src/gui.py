@@ -4,51 +4,232 @@ The GUI of the application.
 Allows defining the magazine shape, defining boxes to fill the magazine (rectangles),
 setting the genetic algorithm parameters, running the algorithm.
 Displays the returned solution -- location of boxes in the magazine, fill factor.
+The magazine grid is kept in a NumPy array (GridModel) and drawn as one bitmap (GridView),
+only the changed parts of it are redrawn.
 04/2020, Kamil Zacharczuk
 """
+import queue
+import threading
 import tkinter as tk
+from tkinter import filedialog
 from tkinter import messagebox
 from tkinter import simpledialog
+import numpy as np
 from solver import *
+from layout import loadLayout, saveLayout
+
+# Largest magazine reachable with the "Change resolution" button, bigger ones can be loaded from files.
+MAX_RESOLUTION = 512
+
+class GridModel:
+    # The magazine grid: fields[y, x] is the FieldState value of the (x, y) field (a layout, see layout.py).
+    # Changed areas are remembered as dirty rectangles (x0, y0, x1, y1), without the x1 column
+    # and the y1 row, until they are taken to be redrawn.
+    def __init__(self, fields):
+        self.fields = fields
+        self.height, self.width = fields.shape
+        self.dirty = [(0, 0, self.width, self.height)]
+
+    def getState(self, x, y):
+        return FieldState(self.fields[y, x])
+
+    def setState(self, x, y, state):
+        self.fillRect(x, y, x+1, y+1, state)
+
+    def fillRect(self, x0, y0, x1, y1, state):
+        self.fields[y0:y1, x0:x1] = state.value
+        self.dirty.append((x0, y0, x1, y1))
+
+    # Set the state of the fields selected by the (height, width) bool mask.
+    def setStates(self, mask, state):
+        self.fields[mask] = state.value
+        rows = np.flatnonzero(mask.any(axis=1))
+        if (rows.size > 0):
+            columns = np.flatnonzero(mask.any(axis=0))
+            self.dirty.append((int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1))
+
+    def replaceState(self, old, new):
+        self.setStates(self.fields == old.value, new)
+
+    def isNextTo(self, x, y, state):
+        # On the left, on the right, above or below.
+        return ((x != 0 and self.fields[y, x-1] == state.value)
+                or (y != 0 and self.fields[y-1, x] == state.value)
+                or (x != self.width-1 and self.fields[y, x+1] == state.value)
+                or (y != self.height-1 and self.fields[y+1, x] == state.value))
+
+    def takeDirty(self):
+        dirty = self.dirty
+        self.dirty = []
+        return dirty
+
+class GridView:
+    # Draws a GridModel on the canvas as one PhotoImage of the canvas size. Every field takes at least
+    # one pixel: a magazine smaller than the canvas is stretched over it, in a bigger one the canvas shows
+    # one pixel per field of the part of the magazine scrolled to (see xview and yview).
+    # RGB colours of the fields by their FieldState value.
+    COLOURS = np.zeros((max(s.value for s in FieldState) + 1, 3), dtype=np.uint8)
+    COLOURS[FieldState.EMPTY.value] = (255, 255, 255)
+    COLOURS[FieldState.WALL.value] = (190, 190, 190)
+    COLOURS[FieldState.BOX.value] = (255, 165, 0)
+    # Fields at least this number of pixels wide (high) get a border.
+    MIN_BORDER_PIXELS = 4
+    # With more dirty rectangles the whole grid is redrawn at once.
+    MAX_DIRTY_RECTS = 64
+    # Scrolling by one unit moves the view by this part of its size.
+    SCROLL_UNIT = 0.1
+
+    def __init__(self, canvas, width, height, xScrollCommand=None, yScrollCommand=None):
+        self.width = width
+        self.height = height
+        self.image = tk.PhotoImage(width=width, height=height)
+        canvas.create_image(0, 0, image=self.image, anchor=tk.NW)
+        self.model = None
+        # Called with the first and the last visible part of the magazine, like the scrollbar set method.
+        self.x_scroll_command = xScrollCommand
+        self.y_scroll_command = yScrollCommand
+
+    def setModel(self, model):
+        self.model = model
+        # The first field shown in the canvas, horizontally and vertically.
+        self.origin_x = 0
+        self.origin_y = 0
+        self.__updateView()
+
+    def __updateView(self):
+        # Field coordinates shown in every pixel column and row.
+        self.field_x = self.__getFields(self.origin_x, self.model.width, self.width)
+        self.field_y = self.__getFields(self.origin_y, self.model.height, self.height)
+        self.border_x = self.__getBorders(self.field_x, self.model.width)
+        self.border_y = self.__getBorders(self.field_y, self.model.height)
+        self.model.takeDirty()
+        self.__drawRect(0, 0, self.model.width, self.model.height)
+        if (self.x_scroll_command is not None):
+            self.x_scroll_command(*self.__getVisiblePart(self.origin_x, self.model.width, self.width))
+        if (self.y_scroll_command is not None):
+            self.y_scroll_command(*self.__getVisiblePart(self.origin_y, self.model.height, self.height))
+
+    def __getFields(self, origin, fieldsCount, pixels):
+        # The fields shown, one pixel per field if they don't fit into the pixels.
+        visible = min(fieldsCount, pixels)
+        return origin + np.arange(pixels) * visible // pixels
+
+    def __getVisiblePart(self, origin, fieldsCount, pixels):
+        return (origin / fieldsCount, min(origin + pixels, fieldsCount) / fieldsCount)
+
+    def __getBorders(self, fields, fieldsCount):
+        # The first pixel of every field, if the fields are big enough.
+        borders = np.zeros(fields.size, dtype=bool)
+        if (fields.size >= self.MIN_BORDER_PIXELS*fieldsCount):
+            borders[0] = True
+            borders[1:] = fields[1:] != fields[:-1]
+        return borders
+
+    # The field shown in the pixel.
+    def getField(self, x, y):
+        x = min(max((int)(x), 0), self.width-1)
+        y = min(max((int)(y), 0), self.height-1)
+        return ((int)(self.field_x[x]), (int)(self.field_y[y]))
+
+    # Scrollbar commands: ("moveto", fraction) or ("scroll", number, "units" or "pages").
+    def xview(self, *args):
+        self.origin_x = self.__scroll(args, self.origin_x, self.model.width, self.width)
+        self.__updateView()
+
+    def yview(self, *args):
+        self.origin_y = self.__scroll(args, self.origin_y, self.model.height, self.height)
+        self.__updateView()
+
+    def __scroll(self, args, origin, fieldsCount, pixels):
+        if (args[0] == "moveto"):
+            origin = (int)(float(args[1]) * fieldsCount)
+        elif (args[0] == "scroll"):
+            step = pixels if args[2] == "pages" else max((int)(pixels * self.SCROLL_UNIT), 1)
+            origin += (int)(args[1]) * step
+        return min(max(origin, 0), max(fieldsCount - pixels, 0))
+
+    def redraw(self):
+        dirty = self.model.takeDirty()
+        if (len(dirty) > self.MAX_DIRTY_RECTS):
+            dirty = [(0, 0, self.model.width, self.model.height)]
+        for rect in dirty:
+            self.__drawRect(*rect)
+
+    def __drawRect(self, x0, y0, x1, y1):
+        # Pixels showing the fields of the rectangle
+        px0, px1 = np.searchsorted(self.field_x, (x0, x1))
+        py0, py1 = np.searchsorted(self.field_y, (y0, y1))
+        if (px0 >= px1 or py0 >= py1): return
+
+        states = self.model.fields[np.ix_(self.field_y[py0:py1], self.field_x[px0:px1])]
+        pixels = self.COLOURS[states]
+        pixels[self.border_y[py0:py1], :] = 0
+        pixels[:, self.border_x[px0:px1]] = 0
+        # One PPM image for the whole rectangle - a single call to Tk.
+        header = "P6 {} {} 255 ".format(px1 - px0, py1 - py0).encode("ascii")
+        self.image.put(header + pixels.tobytes(), to=((int)(px0), (int)(py0)))
 
 class GUI:
     def __init__(self, solver, defaultPopulationSize, defaultIterations, defaultMutationProbability):
         self.solver = solver
         self.magazine_defined = False
         self.solved = False
+        self.running = False   # the algorithm is running in the background thread
+
+        # The background thread puts progress reports and the result here, the GUI polls it.
+        self.solver_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.progress_placement = []   # placement of the best solution displayed during the run
 
         self.populationSize = defaultPopulationSize
         self.iterations = defaultIterations
         self.mutationProbability = defaultMutationProbability
+        # None - every pair of the population gives two children, no elitism (see algorithm.performAlgorithm).
+        self.offspringCount = None
+        self.parentSelection = "tournament"
+        self.elitism = None
 
         # GUI will store the x,y dimensions of user-defined boxes.
         self.boxes = []
 
-        # Dimensions of the magazine grid in pixels 
+        # Dimensions of the magazine grid in pixels
         self.canv_width = 400
         self.canv_height = 300
         # Number of fields in the grid vertically and horizontally
         self.magazine_width = 8
         self.magazine_height = 8
-        
-        self.updateFieldDimensions() # Calculate one field dimensions
-        
+
         # Main window
         self.root = tk.Tk()
         self.root.title("Magazine")
         self.root.resizable(False, False)
 
-        # Magazine grid frame 
+        # Magazine grid frame
         self.canvasFrame = tk.Frame(self.root, bd=4)
         self.canvasFrame.pack(side=tk.LEFT)
         self.canvas = tk.Canvas(self.canvasFrame, bg="white", cursor="arrow", highlightthickness=2,
                             width=self.canv_width, height=self.canv_height)
-        self.canvas.pack()
+        self.canvas.grid(row=0, column=0)
         self.canvas.bind("<Button-1>", self.fieldClicked)
         self.canvas.bind("<B1-Motion>", self.b1MotionUponField)
-        
+        # Magazines with more fields than the canvas has pixels are scrolled.
+        self.xScrollbar = tk.Scrollbar(self.canvasFrame, orient="horizontal")
+        self.xScrollbar.grid(row=1, column=0, sticky="ew")
+        self.yScrollbar = tk.Scrollbar(self.canvasFrame, orient="vertical")
+        self.yScrollbar.grid(row=0, column=1, sticky="ns")
+        self.grid_view = GridView(self.canvas, self.canv_width, self.canv_height,
+                                  self.xScrollbar.set, self.yScrollbar.set)
+        self.xScrollbar.config(command=self.grid_view.xview)
+        self.yScrollbar.config(command=self.grid_view.yview)
+        self.canvas.bind("<MouseWheel>", self.mouseWheelUponField)
+        self.canvas.bind("<Shift-MouseWheel>", self.mouseWheelUponField)
+        self.canvas.bind("<Button-4>", self.mouseWheelUponField)
+        self.canvas.bind("<Button-5>", self.mouseWheelUponField)
+        self.canvas.bind("<Shift-Button-4>", self.mouseWheelUponField)
+        self.canvas.bind("<Shift-Button-5>", self.mouseWheelUponField)
+
         self.createMagazineGrid() # Create the fields
-      
+
         # Several frames all gathered in the controlFrame.
         # They contain buttons, litsbox etc.
         self.controlFrame = tk.Frame(self.root)
@@ -67,16 +248,16 @@ class GUI:
         self.listScrollbar.config(command=self.boxesList.yview)
         self.boxesList.config(yscrollcommand=self.listScrollbar.set)
         self.listScrollbar.pack(side=tk.RIGHT, fill="y")
-        
+
         self.listButtonsFrame = tk.Frame(self.listFrame)
         self.listButtonsFrame.pack()
-        self.addBoxButton = tk.Button(self.listButtonsFrame, text="Add box", 
+        self.addBoxButton = tk.Button(self.listButtonsFrame, text="Add box",
                                     command=lambda:self.addBoxButtonClicked())
         self.addBoxButton.pack(side=tk.LEFT)
         self.removeBoxButton = tk.Button(self.listButtonsFrame, text="Remove box",
                                          command=lambda:self.removeBoxButtonClicked())
         self.removeBoxButton.pack(side=tk.LEFT)
-        
+
         self.magazineButtonsFrame = tk.Frame(self.controlFrame, pady=10)
         self.magazineButtonsFrame.pack()
         self.fillButton = tk.Button(self.magazineButtonsFrame, text="All fields magazine",
@@ -85,6 +266,12 @@ class GUI:
         self.resolutionButton = tk.Button(self.magazineButtonsFrame, text="Change resolution",
                                     command=lambda:self.resolutionButtonClicked())
         self.resolutionButton.pack()
+        self.loadButton = tk.Button(self.magazineButtonsFrame, text="Load magazine",
+                                    command=lambda:self.loadButtonClicked())
+        self.loadButton.pack(side=tk.LEFT)
+        self.saveButton = tk.Button(self.magazineButtonsFrame, text="Save magazine",
+                                    command=lambda:self.saveButtonClicked())
+        self.saveButton.pack(side=tk.LEFT)
 
         self.algorithmButtonsFrame = tk.Frame(self.controlFrame, pady=10, padx=5)
         self.algorithmButtonsFrame.pack()
@@ -95,6 +282,12 @@ class GUI:
         self.performAlgorithmButton = tk.Button(self.algorithmButtonsFrame, text="Perform algorithm",
                                             command=lambda:self.performAlgorithmButtonClicked(), padx=10)
         self.performAlgorithmButton.pack(side=tk.LEFT)
+        self.cancelButton = tk.Button(self.algorithmButtonsFrame, text="Cancel", state="disabled",
+                                      command=lambda:self.cancelButtonClicked())
+        self.cancelButton.pack(side=tk.LEFT)
+
+        self.progressLabel = tk.Label(self.controlFrame, text="", width=40)
+        self.progressLabel.pack()
 
     ## Init functions ##
 
@@ -102,35 +295,29 @@ class GUI:
         # Display the main window
         self.root.mainloop()
 
-    def updateFieldDimensions(self):
-        self.field_width = self.canv_width / self.magazine_width
-        self.field_height = self.canv_height / self.magazine_height
-
-    def createMagazineGrid(self):
-        self.fields = [[0 for x in range (self.magazine_width)] for y in range (self.magazine_height)]
-        for i in range(self.magazine_height):
-            for j in range(self.magazine_width):
-                self.fields[j][i] = \
-                    self.canvas.create_rectangle(j*self.field_width, i*self.field_height, 
-                                                (j+1)*self.field_width, (i+1)*self.field_height, 
-                                                fill="grey")
+    def createMagazineGrid(self, fields=None):
+        # All the fields are walls at first.
+        if (fields is None):
+            fields = np.full((self.magazine_height, self.magazine_width), FieldState.WALL.value, dtype=np.uint8)
+        self.grid_model = GridModel(fields)
+        self.grid_view.setModel(self.grid_model)
 
     ## Magazine grid event handlers ##
 
     def b1MotionUponField(self, event):
         self.fieldClicked(event)
 
+    def mouseWheelUponField(self, event):
+        # Scrolls the magazine, horizontally with Shift. Button 4 and 5 are the wheel on X11.
+        units = -1 if event.num == 4 or getattr(event, "delta", 0) > 0 else 1
+        if (event.state & 0x1): self.grid_view.xview("scroll", units, "units")
+        else: self.grid_view.yview("scroll", units, "units")
+
     def fieldClicked(self, event):
-        if (self.solved): return
-
-        x = (int)(event.x // self.field_width)
-        y = (int)(event.y // self.field_height)
-        if (x > self.magazine_width-1): x = self.magazine_width-1
-        if (y > self.magazine_height-1): y = self.magazine_height-1
-        if (x < 0): x = 0
-        if (y < 0): y = 0
-        
-        if (self.canvas.itemcget(self.fields[x][y], "fill") == "grey"):
+        if (self.solved or self.running): return
+
+        x, y = self.grid_view.getField(event.x, event.y)
+        if (self.grid_model.getState(x, y) == FieldState.WALL):
             self.makeFieldEmptyIfAllowed(x,y)
 
     ## Buttons event handlers ##
@@ -152,27 +339,23 @@ class GUI:
             self.boxesList.delete(tk.ACTIVE)
 
     def fillButtonClicked(self):
-        fill_color = "grey"
+        fill_state = FieldState.WALL
         if (self.fillButton.cget('text') == "All fields magazine"):
-            fill_color = "white"
+            fill_state = FieldState.EMPTY
             self.fillButton.config(text="All fields wall")
         else:
             self.fillButton.config(text="All fields magazine")
             self.magazine_defined = False
 
-        for x in range(self.magazine_width):
-            for y in range(self.magazine_height):
-                self.canvas.itemconfig(self.fields[x][y], fill=fill_color)
+        self.grid_model.fillRect(0, 0, self.magazine_width, self.magazine_height, fill_state)
+        self.grid_view.redraw()
 
     def resolutionButtonClicked(self):
-        if (self.magazine_width == 32): self.magazine_width = 2
+        if (self.magazine_width >= MAX_RESOLUTION): self.magazine_width = 2
         else: self.magazine_width *= 2
-        if (self.magazine_height == 32): self.magazine_height = 2
+        if (self.magazine_height >= MAX_RESOLUTION): self.magazine_height = 2
         else: self.magazine_height *= 2
-        
-        self.updateFieldDimensions()
 
-        del self.fields
         self.magazine_defined = False
         self.createMagazineGrid()
 
@@ -182,16 +365,46 @@ class GUI:
         self.solved = False
         self.performAlgorithmButton.config(text="Perform algorithm")
 
+    def loadButtonClicked(self):
+        path = filedialog.askopenfilename(title="Load magazine",
+                                          filetypes=[("Magazine layouts", "*.txt *.pgm"), ("All files", "*")])
+        if (not path): return
+        try:
+            fields = loadLayout(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if (fields.size == 0):
+            messagebox.showerror("Error", "The magazine is empty")
+            return
+
+        # Boxes saved with a solution are loaded as empty fields.
+        fields[fields == FieldState.BOX.value] = FieldState.EMPTY.value
+        self.magazine_height, self.magazine_width = fields.shape
+        self.createMagazineGrid(fields)
+        self.magazine_defined = bool((fields == FieldState.EMPTY.value).any())
+        self.fillButton.config(text="All fields wall" if self.magazine_defined else "All fields magazine")
+
+    def saveButtonClicked(self):
+        # The magazine is saved with the displayed solution.
+        path = filedialog.asksaveasfilename(title="Save magazine", defaultextension=".pgm",
+                                            filetypes=[("PGM image", "*.pgm"), ("Text bitmap", "*.txt")])
+        if (not path): return
+        try:
+            saveLayout(path, self.grid_model.fields)
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
+
     def algorithmParamsButtonClicked(self):
         # Create a pop-up window
         window = tk.Toplevel(width=250)
         window.title("Enter parameters")
-        window.geometry("%dx%d+%d+%d" % (275, 100, self.root.winfo_x() + 100, self.root.winfo_y() + 100))
+        window.geometry("%dx%d+%d+%d" % (300, 175, self.root.winfo_x() + 100, self.root.winfo_y() + 100))
         window.grab_set()
 
         entryFrame = tk.Frame(window)
         entryFrame.pack()
-        
+
         # Fill the entries with stored parameters' values
         populationSizeLabel = tk.Label(entryFrame, text="Population size: ")
         populationSizeEntry = tk.Entry(entryFrame)
@@ -202,89 +415,173 @@ class GUI:
         probabilityLabel = tk.Label(entryFrame, text="Mutation probability: ")
         probabilityEntry = tk.Entry(entryFrame)
         probabilityEntry.insert(0, "{:.3f}".format(self.mutationProbability))
+        # Empty offspring count - every pair of the population is crossed, empty elitism - no elitism.
+        offspringLabel = tk.Label(entryFrame, text="Offspring count: ")
+        offspringEntry = tk.Entry(entryFrame)
+        offspringEntry.insert(0, self.offspringCount if self.offspringCount is not None else "")
+        selectionLabel = tk.Label(entryFrame, text="Parent selection: ")
+        selectionVariable = tk.StringVar(window, value=self.parentSelection)
+        selectionMenu = tk.OptionMenu(entryFrame, selectionVariable, "tournament", "roulette", "rank")
+        elitismLabel = tk.Label(entryFrame, text="Elitism: ")
+        elitismEntry = tk.Entry(entryFrame)
+        elitismEntry.insert(0, self.elitism if self.elitism is not None else "")
         populationSizeLabel.grid(row=0, column=0)
         populationSizeEntry.grid(row=0, column=1)
         iterationsLabel.grid(row=1, column=0)
         iterationsEntry.grid(row=1, column=1)
         probabilityLabel.grid(row=2, column=0)
         probabilityEntry.grid(row=2, column=1)
+        offspringLabel.grid(row=3, column=0)
+        offspringEntry.grid(row=3, column=1)
+        selectionLabel.grid(row=4, column=0)
+        selectionMenu.grid(row=4, column=1, sticky="ew")
+        elitismLabel.grid(row=5, column=0)
+        elitismEntry.grid(row=5, column=1)
 
         buttonFrame = tk.Frame(window)
         buttonFrame.pack()
-        okButton = tk.Button(buttonFrame, text="OK", 
-                             command=lambda: self.algorithmParamsOKButtonClicked(window, populationSizeEntry, 
-                                                                                 iterationsEntry, probabilityEntry))
+        okButton = tk.Button(buttonFrame, text="OK",
+                             command=lambda: self.algorithmParamsOKButtonClicked(window, populationSizeEntry,
+                                                                                 iterationsEntry, probabilityEntry,
+                                                                                 offspringEntry, selectionVariable,
+                                                                                 elitismEntry))
         okButton.pack()
 
     # Button in the pop-up window
-    def algorithmParamsOKButtonClicked(self, window, populationSizeEntry, iterationsEntry, probabilityEntry):
+    def algorithmParamsOKButtonClicked(self, window, populationSizeEntry, iterationsEntry, probabilityEntry,
+                                       offspringEntry, selectionVariable, elitismEntry):
         self.populationSize = (int)(populationSizeEntry.get())
         self.iterations = (int)(iterationsEntry.get())
         self.mutationProbability = (float)(probabilityEntry.get())
+        self.offspringCount = (int)(offspringEntry.get()) if offspringEntry.get().strip() else None
+        self.parentSelection = selectionVariable.get()
+        self.elitism = (int)(elitismEntry.get()) if elitismEntry.get().strip() else None
         window.destroy()
 
     def performAlgorithmButtonClicked(self):
+        if (self.running): return
         if (not self.solved): # A solution is not displayed on the grid
             magazine_shape = self.getMagazineShape()
 
-            winner = self.solver.solve(magazine_shape, self.boxes, self.populationSize, self.iterations,
-                                       self.mutationProbability)
-   
-            for x in range(self.magazine_width):
-                for y in range(self.magazine_height):
-                    if (winner[0][x][y] == "box"):
-                        self.canvas.itemconfig(self.fields[x][y], fill="orange")
-
-            # Only block reshaping the magazine until the "Clear magazine" button is clicked 
-            # if there is any box displayed in the magazine (fill factor > 0).
-            if (winner[1] > 0):
-                self.solved = True
-                self.fillButton.config(state="disabled")
-                self.resolutionButton.config(state="disabled")
-                # To avoid automatical window resizing
-                self.algorithmButtonsFrame.pack_propagate(False)
-                
-                self.performAlgorithmButton.config(text="Clear magazine")
-
-            # Display fill factor
-            msg = "Optimum filling rate: " + "{:.4f}".format(winner[1])
-            messagebox.showinfo("Winner is...", msg)
+            # Run the algorithm in the background, the window keeps responding.
+            self.running = True
+            self.stop_event.clear()
+            self.progress_placement = []
+            self.setControlsState("disabled")
+            self.cancelButton.config(state="normal")
+            self.progressLabel.config(text="Starting...")
+            threading.Thread(target=self.runSolver, args=(magazine_shape,), daemon=True).start()
+            self.root.after(100, self.pollSolver)
 
         else: # A solution is displayed on the grid - this button is now to clear it.
             self.solved = False
             self.performAlgorithmButton.config(text="Perform algorithm")
             self.fillButton.config(state="normal")
             self.resolutionButton.config(state="normal")
-
-            for x in range(self.magazine_width):
-                for y in range(self.magazine_height):
-                    if (self.canvas.itemcget(self.fields[x][y], "fill") == "orange"):
-                        self.canvas.itemconfig(self.fields[x][y], fill="white")
-
-    ## Other functions 
-
-    # Get the map of empty & wall fields in the magazine for the use of the solver.
+            self.loadButton.config(state="normal")
+            self.progressLabel.config(text="")
+
+            self.grid_model.replaceState(FieldState.BOX, FieldState.EMPTY)
+            self.grid_view.redraw()
+
+    def cancelButtonClicked(self):
+        # The algorithm stops after the current generation and returns the best solution so far.
+        self.stop_event.set()
+        self.cancelButton.config(state="disabled")
+        self.progressLabel.config(text="Cancelling...")
+
+    # Runs in the background thread - must not touch the widgets.
+    def runSolver(self, magazine_shape):
+        def reportProgress(generation, best, mean, evaluationsPerSecond, placement):
+            self.solver_queue.put(("progress", (generation, best, mean, evaluationsPerSecond, placement)))
+        try:
+            winner = self.solver.solve(magazine_shape, self.boxes, self.populationSize, self.iterations,
+                                       self.mutationProbability, progressCallback=reportProgress,
+                                       stopEvent=self.stop_event, offspringCount=self.offspringCount,
+                                       parentSelection=self.parentSelection, elitism=self.elitism)
+            self.solver_queue.put(("done", winner))
+        except Exception as e:
+            self.solver_queue.put(("error", e))
+
+    def pollSolver(self):
+        progress = None
+        while (True):
+            try:
+                kind, data = self.solver_queue.get_nowait()
+            except queue.Empty:
+                break
+            if (kind == "progress"):
+                progress = data  # only the latest report is worth displaying
+            else:
+                self.running = False
+                self.setControlsState("normal")
+                self.cancelButton.config(state="disabled")
+                if (kind == "done"):
+                    self.displayWinner(data)
+                else:
+                    self.drawPlacement([])
+                    self.progressLabel.config(text="")
+                    messagebox.showerror("Error", str(data))
+                return
+
+        if (progress is not None):
+            generation, best, mean, evaluationsPerSecond, placement = progress
+            self.drawPlacement(placement)
+            self.progressLabel.config(text="Generation {}: best {:.4f}, mean {:.4f}, {:.0f} eval/s".format(
+                generation, best, mean, evaluationsPerSecond))
+        self.root.after(100, self.pollSolver)
+
+    def displayWinner(self, winner):
+        # The winner magazine is returned as a layout, like the one given to the solver.
+        self.drawPlacement([])
+        self.grid_model.setStates(winner[0] == FieldState.BOX.value, FieldState.BOX)
+        self.grid_view.redraw()
+
+        # Only block reshaping the magazine until the "Clear magazine" button is clicked
+        # if there is any box displayed in the magazine (fill factor > 0).
+        if (winner[1] > 0):
+            self.solved = True
+            self.fillButton.config(state="disabled")
+            self.resolutionButton.config(state="disabled")
+            self.loadButton.config(state="disabled")
+            # To avoid automatical window resizing
+            self.algorithmButtonsFrame.pack_propagate(False)
+
+            self.performAlgorithmButton.config(text="Clear magazine")
+
+        # Display fill factor
+        msg = "Optimum filling rate: " + "{:.4f}".format(winner[1])
+        messagebox.showinfo("Winner is...", msg)
+
+    # Paint the boxes of the placement reported during the run, erasing the previous one.
+    def drawPlacement(self, placement):
+        for i, x, y in self.progress_placement:
+            self.fillBoxFields(i, x, y, FieldState.EMPTY)
+        for i, x, y in placement:
+            self.fillBoxFields(i, x, y, FieldState.BOX)
+        self.progress_placement = placement
+        self.grid_view.redraw()
+
+    def fillBoxFields(self, i, x, y, state):
+        len_x, len_y = self.boxes[i]
+        self.grid_model.fillRect(x, y, x + len_x, y + len_y, state)
+
+    def setControlsState(self, state):
+        for button in (self.addBoxButton, self.removeBoxButton, self.fillButton, self.resolutionButton,
+                       self.loadButton, self.saveButton, self.algorithmParamsButton, self.performAlgorithmButton):
+            button.config(state=state)
+
+    ## Other functions
+
+    # Get the map of empty & wall fields in the magazine for the use of the solver, as a layout.
     def getMagazineShape(self):
-        shape = [[0 for x in range(self.magazine_width)] for y in range (self.magazine_height)]
-
-        for x in range(self.magazine_width):
-            for y in range(self.magazine_height):
-                if (self.canvas.itemcget(self.fields[x][y], "fill") == "white"):
-                    shape[x][y] = "empty"
-                else: shape[x][y] = "wall"
-
-        return shape
+        return self.grid_model.fields.copy()
 
     # Turn a wall field into an empty field after making sure that you can.
     def makeFieldEmptyIfAllowed(self, x, y):
         # Empty field can only be placed next to another empty field
         # unless there is none (magazine_defined == False).
-        if (
-            (not self.magazine_defined)
-            or (x != 0 and self.canvas.itemcget(self.fields[x-1][y], "fill") == "white")
-            or (y != 0 and self.canvas.itemcget(self.fields[x][y-1], "fill") == "white")
-            or (x != self.magazine_width-1 and self.canvas.itemcget(self.fields[x+1][y], "fill") == "white")
-            or (y != self.magazine_height-1 and self.canvas.itemcget(self.fields[x][y+1], "fill") == "white")
-        ):
+        if ((not self.magazine_defined) or self.grid_model.isNextTo(x, y, FieldState.EMPTY)):
             self.magazine_defined = True
-            self.canvas.itemconfig(self.fields[x][y], fill="white")
\ No newline at end of file
+            self.grid_model.setState(x, y, FieldState.EMPTY)
+            self.grid_view.redraw()
@@ -0,0 +1,98 @@
+"""
+incremental.py
+Incremental decoding of genotypes. Boxes are inserted greedily in the genotype
+order, so genotypes starting with the same boxes share the same partial magazine.
+The decoder saves magazine states at every snapshotInterval-th box in a trie
+keyed by the box prefix and resumes decoding from the longest saved prefix.
+The number of saved states is bounded, the least recently used ones are dropped.
+The gain depends on how many boxes are skipped: skipped_boxes against add_box_calls, reported by
+performAlgorithm as prefix_skipped_boxes and prefix_add_box_calls. Saving and restoring the states costs
+about as much as it saves when few boxes are skipped - on small instances, where decoding is cheap anyway,
+and with diverse populations sharing only short prefixes - so incremental decoding is off by default.
+"""
+from collections import OrderedDict
+
+class PrefixNode:
+    __slots__ = ("parent", "label", "children", "state")
+
+    def __init__(self, parent, label):
+        self.parent = parent
+        self.label = label   # dimensions of the boxes on the edge from the parent
+        self.children = {}
+        self.state = None    # saved magazine state after the boxes of the prefix
+
+class PrefixDecoder:
+    def __init__(self, magazine, boxes, snapshotInterval=4, maxSnapshots=4096):
+        self.magazine = magazine
+        self.boxes = boxes
+        self.snapshot_interval = snapshotInterval
+        self.max_snapshots = maxSnapshots
+        self.root = PrefixNode(None, None)
+        self.snapshots = OrderedDict()   # nodes holding a state, least recently used first
+
+        self.add_box_calls = 0    # boxes actually inserted into the magazine
+        self.skipped_boxes = 0    # boxes not inserted thanks to the saved states
+
+    def evaluate(self, genotypes):
+        result = [self.decode(g) for g in genotypes]
+        self.magazine.removeAllBoxes()
+        return result
+
+    def decode(self, genotype):
+        # Go down the trie along the genotype and find the longest prefix with a saved state.
+        genotype_len = len(genotype)
+        path = []
+        node = self.root
+        depth = 0
+        resume_at = 0
+        while (depth + self.snapshot_interval < genotype_len):
+            node = node.children.get(self.__label(genotype, depth))
+            if (node is None): break
+            depth += self.snapshot_interval
+            path.append(node)
+            if (node.state is not None): resume_at = len(path)
+
+        if (resume_at > 0):
+            node = path[resume_at-1]
+            self.magazine.restoreState(node.state)
+            self.snapshots.move_to_end(node)
+        else:
+            node = self.root
+            self.magazine.removeAllBoxes()
+        depth = resume_at * self.snapshot_interval
+        self.skipped_boxes += depth
+
+        # Insert the remaining boxes, saving the states at the trie nodes on the way.
+        while (depth < genotype_len):
+            next_depth = min(depth + self.snapshot_interval, genotype_len)
+            for i in genotype[depth:next_depth]:
+                self.magazine.addBox(self.boxes[i])
+            self.add_box_calls += next_depth - depth
+
+            if (next_depth < genotype_len):
+                label = self.__label(genotype, depth)
+                child = node.children.get(label)
+                if (child is None):
+                    child = PrefixNode(node, label)
+                    node.children[label] = child
+                if (child.state is None):
+                    child.state = self.magazine.saveState()
+                    self.snapshots[child] = None
+                    if (len(self.snapshots) > self.max_snapshots):
+                        self.__evict()
+                node = child
+            depth = next_depth
+
+        return self.magazine.fill_factor
+
+    def __label(self, genotype, depth):
+        return tuple((self.boxes[i].len_x, self.boxes[i].len_y)
+                     for i in genotype[depth:depth+self.snapshot_interval])
+
+    def __evict(self):
+        node, _ = self.snapshots.popitem(last=False)
+        node.state = None
+        # Remove the nodes which lead to no saved state anymore.
+        while (node is not self.root and node.state is None and not node.children):
+            del node.parent.children[node.label]
+            node = node.parent
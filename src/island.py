@@ -0,0 +1,158 @@
+"""
+island.py
+Island model of the genetic algorithm. Several independent populations evolve
+in separate processes and every migrationInterval generations each island sends
+copies of its best genotypes to its neighbours, which replace their worst ones.
+Topologies: "ring" (island i sends to island i+1) and "full" (every island sends to all the others).
+The best genotype found on all the islands is returned.
+After every migration interval the islands report their best fitness to the coordinator and wait
+for its decision, so the stopping criteria (see algorithm.StoppingCriteria) and the stop event
+stop all of them together; the coordinator reports the progress of all the islands then.
+"""
+import multiprocessing
+import queue
+import random
+import time
+from algorithm import *
+
+def getNeighbours(island, islands, topology):
+    if (islands == 1): return []
+    if (topology == "ring"):
+        return [(island + 1) % islands]
+    if (topology == "full"):
+        return [i for i in range(islands) if i != island]
+    raise ValueError("Unknown island topology: " + str(topology))
+
+def runIsland(island, seed, magazine, boxTypes, populationSize, iterations, mutationProbability, migrationInterval,
+              migrants, neighbours, sources, inboxes, results, control, options):
+    try:
+        # Every island has its own stream of random numbers.
+        rng = random.Random(seed)
+        fitness_cache = FitnessCache(options["cacheSize"]) if options["cacheSize"] else None
+        fitness = createFitnessFunction(magazine, boxTypes.types, fitness_cache, 1, options["incremental"],
+                                        options["batchEvaluation"])
+        local_search = None
+        if (options["localSearch"] > 0):
+            from localsearch import LocalSearch
+            local_search = LocalSearch(magazine, boxTypes.types, options["localSearch"],
+                                       options["localSearchMoves"])
+        population = None
+        fitness_values = [0.0]
+        generations = 0
+        while (generations < iterations):
+            epoch = min(migrationInterval, iterations - generations)
+            population, fitness_values, run = evolve(boxTypes, populationSize, epoch, mutationProbability, fitness,
+                                                     options["batchOperators"], population=population, rng=rng,
+                                                     offspringCount=options["offspringCount"],
+                                                     parentSelection=options["parentSelection"],
+                                                     elitism=options["elitism"], localSearch=local_search)
+            generations += run
+
+            # The coordinator checks the stopping criteria for all the islands, the last epoch ends anyway.
+            results.put(("epoch", island, generations, fitness_values[0],
+                         sum(fitness_values) / len(fitness_values), population[0], fitness.evaluations))
+            if (generations >= iterations): break
+            if (control.get() is not None): break
+            if (not neighbours): continue
+
+            # Send the best genotypes to the neighbours, replace the worst ones with the received.
+            for n in neighbours:
+                inboxes[n].put(population[:migrants])
+            received = []
+            for i in range(sources):
+                received.extend(inboxes[island].get())
+            if (received):
+                population = population[:max(len(population) - len(received), 0)] + received
+                population = population[:populationSize]
+
+        # The last population is sorted by fitness.
+        results.put(("done", island, population[0], fitness_values[0], generations,
+                     fitness.evaluations, fitness.decodes))
+    except Exception as e:
+        results.put(("error", island, repr(e)))
+
+# Genotypes are permutations of indexes into the boxes list, as in performAlgorithm.
+# If a stats dict is given, it is filled with the numbers of generations (per island),
+# fitness evaluations and decodes (summed over the islands) and the stop reason.
+# stallGenerations, targetFitness, timeBudget and stopAtUpperBound are described at performAlgorithm;
+# they are checked at the end of every migration interval, as is the stopEvent.
+# progressCallback is called at the end of every migration interval, as in performAlgorithm,
+# with the best genotype of all the islands, the mean fitness of the islands and their summed evaluations.
+def performIslandAlgorithm(magazine, boxes, populationSize, iterations, mutationProbability, islands=4,
+                           migrationInterval=5, migrants=1, topology="ring", cacheSize=4096, incremental=False,
+                           batchOperators=False, stats=None, rng=random, batchEvaluation=False, offspringCount=None,
+                           parentSelection="tournament", elitism=None, localSearch=0, localSearchMoves=32,
+                           stallGenerations=None, targetFitness=None, timeBudget=None, stopAtUpperBound=True,
+                           progressCallback=None, stopEvent=None):
+    if (not boxes): return []
+
+    box_types = BoxTypes(boxes)
+    # Checked after every migration interval, with the best fitness of all the islands.
+    stopping = StoppingCriteria(stallGenerations, targetFitness,
+                                getUpperBound(magazine, boxes) if stopAtUpperBound else None, timeBudget)
+    neighbours = [getNeighbours(i, islands, topology) for i in range(islands)]
+    sources = [sum(i in n for n in neighbours) for i in range(islands)]
+    options = {"cacheSize": cacheSize, "incremental": incremental, "batchOperators": batchOperators,
+               "batchEvaluation": batchEvaluation, "offspringCount": offspringCount,
+               "parentSelection": parentSelection, "elitism": elitism, "localSearch": localSearch,
+               "localSearchMoves": localSearchMoves}
+    inboxes = [multiprocessing.Queue() for i in range(islands)]
+    results = multiprocessing.Queue()
+    controls = [multiprocessing.Queue() for i in range(islands)]
+
+    # Island seeds come from rng (random.Random or the random module), so seeding it makes the whole run repeatable.
+    start_time = time.perf_counter()
+    processes = []
+    for i in range(islands):
+        processes.append(multiprocessing.Process(
+            target=runIsland, daemon=True,
+            args=(i, rng.getrandbits(64), magazine, box_types, populationSize, iterations, mutationProbability,
+                  max(1, migrationInterval), migrants, neighbours[i], sources[i], inboxes, results, controls[i],
+                  options)))
+    for p in processes:
+        p.start()
+
+    try:
+        finished = []
+        epochs = {}   # generation -> best fitness values of the islands which reached it
+        checked_generation = 0
+        while (len(finished) < islands):
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                if (any(not p.is_alive() and p.exitcode != 0 for p in processes)):
+                    raise RuntimeError("An island process died")
+                continue
+            if (result[0] == "error"):
+                raise RuntimeError("Island {} failed: {}".format(result[1], result[2]))
+            if (result[0] == "epoch"):
+                generation = result[2]
+                epochs.setdefault(generation, []).append(result[3:])
+                if (len(epochs[generation]) == islands):
+                    # Every island waits for the decision, except after the last epoch.
+                    reports = epochs.pop(generation)
+                    best = max(reports, key=lambda r: r[0])
+                    if (progressCallback is not None):
+                        evaluations_per_second = sum(r[3] for r in reports) / max(time.perf_counter() - start_time,
+                                                                                   1e-9)
+                        progressCallback(generation, best[0], sum(r[1] for r in reports) / islands,
+                                         evaluations_per_second, box_types.boxIndexes(best[2]))
+                    reason = stopping.check(best[0], generation - checked_generation)
+                    if (stopEvent is not None and stopEvent.is_set()):
+                        reason = stopping.reason = "cancelled"
+                    checked_generation = generation
+                    if (generation < iterations):
+                        for control in controls:
+                            control.put(reason)
+                continue
+            finished.append(result)
+    finally:
+        for p in processes:
+            if (p.is_alive()): p.terminate()
+            p.join()
+
+    best = max(finished, key=lambda r: r[3])
+    if (stats is not None):
+        stats.update(generations=max(r[4] for r in finished), evaluations=sum(r[5] for r in finished),
+                     decodes=sum(r[6] for r in finished), stop_reason=stopping.reason or "iterations")
+    return box_types.boxIndexes(best[2])
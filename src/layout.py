@@ -0,0 +1,155 @@
+"""
+layout.py
+Magazine layouts stored in files, for magazines far too big to be defined field by field.
+A layout is a 2D uint8 NumPy array: layout[y, x] is the FieldState value of the (x, y) field,
+the same as the grid of bitmap.BitmapMagazine. Solver.solve takes a layout instead of
+the magazine shape and returns the solution as a layout, which can be saved again.
+Files:
+    text bitmap - one line per row of fields: "#" is a wall, "o" a box field, any other character
+                  an empty field; rows shorter than the longest one are filled up with walls
+    PGM (binary "P5") - dark pixels are walls, grey ones box fields and light ones empty fields
+The files are memory-mapped and converted to the layout with array operations,
+without any per-field Python objects.
+"""
+import mmap
+import os
+import numpy as np
+from magazine import FieldState
+
+WALL_CHAR = ord("#")
+BOX_CHAR = ord("o")
+EMPTY_CHAR = ord(".")
+# Pixel values of the written PGM files.
+WALL_PIXEL = 0
+BOX_PIXEL = 128
+EMPTY_PIXEL = 255
+
+def loadLayout(path):
+    with open(path, "rb") as f:
+        if (f.read(2) == b"P5"):
+            return loadPgm(path)
+    return loadText(path)
+
+def saveLayout(path, layout):
+    if (path.lower().endswith(".pgm")):
+        savePgm(path, layout)
+    else:
+        saveText(path, layout)
+
+# The layout of a magazine shape in the form taken by Solver.solve: shape[x][y] is "wall", "box" or "empty".
+def getLayoutFromShape(magazineShape):
+    layout = np.full((len(magazineShape[0]), len(magazineShape)), FieldState.EMPTY.value, dtype=np.uint8)
+    for x, column in enumerate(magazineShape):
+        for y, state in enumerate(column):
+            if (state == "wall"): layout[y, x] = FieldState.WALL.value
+            elif (state == "box"): layout[y, x] = FieldState.BOX.value
+    return layout
+
+# The layout of a magazine with the walls of magazine.getWalls(): one byte for every field, 1 for a wall.
+def getLayoutFromWalls(walls, X, Y):
+    wall_fields = np.frombuffer(walls, dtype=np.uint8).reshape(Y, X)
+    return np.where(wall_fields, FieldState.WALL.value, FieldState.EMPTY.value).astype(np.uint8)
+
+def mapFile(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def loadText(path):
+    # An empty file can't be memory-mapped.
+    if (os.path.getsize(path) == 0): raise ValueError("No fields in the layout file: " + str(path))
+    data = mapFile(path)
+    try:
+        rows = getTextRows(data)
+        if (rows is None):
+            # Rows of different lengths - filled up with walls to the longest one.
+            lines = bytes(data).splitlines()
+            while (lines and not lines[-1].strip()):
+                lines.pop()
+            width = max((len(line) for line in lines), default=0)
+            rows = np.frombuffer(b"".join(line.ljust(width, b"#") for line in lines), dtype=np.uint8)
+            rows = rows.reshape(len(lines), width)
+        # Character code -> FieldState value
+        table = np.full(256, FieldState.EMPTY.value, dtype=np.uint8)
+        table[WALL_CHAR] = FieldState.WALL.value
+        table[BOX_CHAR] = FieldState.BOX.value
+        layout = table[rows]
+        del rows
+    finally:
+        data.close()
+    if (layout.size == 0): raise ValueError("No fields in the layout file: " + str(path))
+    return layout
+
+def getTextRows(data):
+    # View of the mapped file as a 2D array of rows, if all the rows are of the same length, otherwise None.
+    chars = np.frombuffer(data, dtype=np.uint8)
+    line_len = data.find(b"\n") + 1
+    if (line_len == 0):
+        return chars.reshape(1, -1)
+    ending = 2 if line_len > 1 and chars[line_len-2] == ord("\r") else 1
+    width = line_len - ending
+    if (chars.size % line_len == 0):
+        rows = chars.reshape(-1, line_len)
+        last = None
+    elif ((chars.size + ending) % line_len == 0):
+        # The last line comes without its line ending.
+        rows = chars[:chars.size - width].reshape(-1, line_len)
+        last = chars[chars.size - width:]
+        if (np.isin(last, (ord("\n"), ord("\r"))).any()): return None
+    else:
+        return None
+    if (not (rows[:, -1] == ord("\n")).all()): return None
+    if (ending == 2 and not (rows[:, -2] == ord("\r")).all()): return None
+    if (last is not None):
+        return np.vstack((rows[:, :width], last[None, :]))
+    return rows[:, :width]
+
+def saveText(path, layout):
+    table = np.full(256, EMPTY_CHAR, dtype=np.uint8)
+    table[FieldState.WALL.value] = WALL_CHAR
+    table[FieldState.BOX.value] = BOX_CHAR
+    rows = np.empty((layout.shape[0], layout.shape[1] + 1), dtype=np.uint8)
+    rows[:, :-1] = table[layout]
+    rows[:, -1] = ord("\n")
+    rows.tofile(path)
+
+def loadPgm(path):
+    data = mapFile(path)
+    try:
+        # Header: "P5", width, height, maxval separated by whitespace, "#" comments,
+        # and a single whitespace character before the pixels.
+        fields = []
+        i = 2
+        while (len(fields) < 3):
+            if (data[i:i+1].isspace()):
+                i += 1
+            elif (data[i:i+1] == b"#"):
+                i = data.find(b"\n", i) + 1
+                if (i == 0): raise ValueError("Truncated PGM header: " + str(path))
+            else:
+                start = i
+                while (i < len(data) and not data[i:i+1].isspace()):
+                    i += 1
+                fields.append(int(data[start:i]))
+        width, height, maxval = fields
+        if (maxval > 255):
+            raise ValueError("Only 8 bit PGM files are supported: " + str(path))
+        if (width*height == 0): raise ValueError("No fields in the layout file: " + str(path))
+        pixels = np.frombuffer(data, dtype=np.uint8, count=width*height, offset=i+1).reshape(height, width)
+
+        # Pixel value -> FieldState value
+        table = np.full(256, FieldState.EMPTY.value, dtype=np.uint8)
+        table[:maxval // 3 + 1] = FieldState.WALL.value
+        table[maxval // 3 + 1:2*maxval // 3 + 1] = FieldState.BOX.value
+        layout = table[pixels]
+        del pixels
+    finally:
+        data.close()
+    return layout
+
+def savePgm(path, layout):
+    table = np.full(256, EMPTY_PIXEL, dtype=np.uint8)
+    table[FieldState.WALL.value] = WALL_PIXEL
+    table[FieldState.BOX.value] = BOX_PIXEL
+    with open(path, "wb") as f:
+        f.write("P5\n{} {}\n255\n".format(layout.shape[1], layout.shape[0]).encode("ascii"))
+        table[layout].tofile(f)
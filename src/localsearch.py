@@ -0,0 +1,81 @@
+"""
+localsearch.py
+Local search of the memetic variant of the genetic algorithm. The best genotypes
+of every generation are improved by moves of single boxes: swaps of two neighbouring
+boxes and insertions of a box at another position. Boxes are inserted greedily
+in the genotype order, so a move doesn't change the placement of the boxes before
+the first changed position - the magazine state saved there is restored and only
+the rest of the genotype is decoded again.
+"""
+import random
+
+# Smaller gains are differences in rounding of the summed fill factors, not improvements.
+IMPROVEMENT_TOLERANCE = 1e-9
+
+class LocalSearch:
+    def __init__(self, magazine, boxes, elite=1, moves=32):
+        self.magazine = magazine
+        self.boxes = boxes
+        self.elite = elite    # number of the best genotypes improved in every generation
+        self.moves = moves    # moves tried for every genotype
+        self.evaluated_moves = 0
+        self.improvements = 0
+        self.decoded_boxes = 0    # boxes inserted while evaluating the moves
+        self.skipped_boxes = 0    # boxes not inserted thanks to the saved states
+
+    # First-improvement hill climbing with random moves. genotype is an array of box types;
+    # returns the best genotype found (the given one if no move improves it) and its fitness value.
+    def improve(self, genotype, rng=random):
+        magazine = self.magazine
+        magazine.removeAllBoxes()
+        # marks[i] is the state of the magazine before the i-th box of the genotype is inserted:
+        # fill factor, next box index and the number of the boxes inserted, placed_boxes are their positions.
+        marks = []
+        self.__decode(genotype, 0, marks)
+        fitness = magazine.fill_factor
+        placed_boxes = list(magazine.placed_boxes)
+
+        genotype_len = len(genotype)
+        for move in range(self.moves if genotype_len > 1 else 0):
+            candidate = genotype[:]
+            i = rng.randrange(genotype_len - 1)
+            if (rng.random() < 0.5):
+                # Swap with the next box
+                j = i + 1
+                candidate[i], candidate[j] = candidate[j], candidate[i]
+            else:
+                # Move the box to another position
+                j = rng.randrange(genotype_len)
+                candidate.insert(j, candidate.pop(i))
+
+            # Boxes of the same type moved past each other change nothing.
+            first = min(i, j)
+            last = max(i, j)
+            while (first <= last and candidate[first] == genotype[first]):
+                first += 1
+            if (first > last): continue
+
+            self.evaluated_moves += 1
+            fill_factor, next_box_index, placed_count = marks[first]
+            magazine.restoreState((fill_factor, next_box_index, tuple(placed_boxes[:placed_count])))
+            self.skipped_boxes += first
+            candidate_marks = marks[:first]
+            self.__decode(candidate, first, candidate_marks)
+
+            if (magazine.fill_factor > fitness + IMPROVEMENT_TOLERANCE):
+                self.improvements += 1
+                genotype = candidate
+                fitness = magazine.fill_factor
+                marks = candidate_marks
+                placed_boxes = list(magazine.placed_boxes)
+
+        magazine.removeAllBoxes()
+        return (genotype, fitness)
+
+    def __decode(self, genotype, start, marks):
+        # Insert the boxes from the start position on, saving the marks before every one of them.
+        magazine = self.magazine
+        for i in range(start, len(genotype)):
+            marks.append((magazine.fill_factor, magazine.next_box_index, len(magazine.placed_boxes)))
+            magazine.addBox(self.boxes[genotype[i]])
+        self.decoded_boxes += len(genotype) - start
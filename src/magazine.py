@@ -12,16 +12,106 @@ class FieldState(Enum):
     WALL = 3
 
 class Field:
+    __slots__ = ("x", "y", "state")
+
     def __init__(self, x, y, state):
         self.x = x
         self.y = y
         self.state = state
 
 class Box:
+    __slots__ = ("len_x", "len_y")
+
     def __init__(self, len_x, len_y):
         self.len_x = len_x
         self.len_y = len_y
 
+class BoxTypes:
+    # Table of the distinct box dimensions. Boxes of the same dimensions share one type (the first such Box),
+    # so a genotype is a sequence of type ids - indexes into types - with every type repeated counts[id] times.
+    # Genotypes are arrays of typecode, 2 bytes per box for up to 65536 types.
+    def __init__(self, boxes):
+        self.types = []
+        self.counts = []
+        self.type_ids = []   # type id of every box
+        ids = {}
+        for b in boxes:
+            key = (b.len_x, b.len_y)
+            if (key not in ids):
+                ids[key] = len(self.types)
+                self.types.append(b)
+                self.counts.append(0)
+            self.counts[ids[key]] += 1
+            self.type_ids.append(ids[key])
+        self.typecode = "H" if len(self.types) <= 1 << 16 else "I"
+
+    # Indexes of the boxes in the order of the genotype: the k-th occurrence of a type is its k-th box.
+    def boxIndexes(self, genotype):
+        boxes_of_type = [[] for t in self.types]
+        for i in range(len(self.type_ids) - 1, -1, -1):
+            boxes_of_type[self.type_ids[i]].append(i)
+        return [boxes_of_type[t].pop() for t in genotype]
+
+class WallMap:
+    # Structures derived from the walls. The walls don't change while solving,
+    # so they are calculated once and used by every placement attempt.
+    def __init__(self, X, Y, walls):
+        # walls[i] tells if the field with index i (x + y*X) is a wall.
+        self.X = X
+        self.Y = Y
+        # Integral image: sat[x + y*(X+1)] is the number of walls with coordinates below x and below y.
+        self.sat = [0] * ((X+1)*(Y+1))
+        for y in range(Y):
+            row_walls = 0
+            for x in range(X):
+                row_walls += 1 if walls[x + y*X] else 0
+                self.sat[(x+1) + (y+1)*(X+1)] = self.sat[(x+1) + y*(X+1)] + row_walls
+        # The tallest box which can start in every field, as far as walls are concerned:
+        # free_down[i] is the number of fields up to the nearest wall (or the magazine edge) down.
+        # The width is checked with the free runs of the magazine, which include the walls.
+        self.free_down = [0] * (X*Y)
+        for y in range(Y-1, -1, -1):
+            for x in range(X):
+                i = x + y*X
+                if (not walls[i]):
+                    self.free_down[i] = (self.free_down[i+X] if y+1 < Y else 0) + 1
+        self.last_starts = {}
+        self.next_tall = {}
+
+    def wallsIn(self, x, y, len_x, len_y):
+        # Number of walls in the rectangle with the upper-left corner in (x, y).
+        W = self.X + 1
+        return (self.sat[(x+len_x) + (y+len_y)*W] - self.sat[x + (y+len_y)*W]
+                - self.sat[(x+len_x) + y*W] + self.sat[x + y*W])
+
+    def lastStart(self, len_x, len_y):
+        # Index of the last field in which a box of this size can start without covering a wall,
+        # -1 if there is none. Calculated once for every box size.
+        key = (len_x, len_y)
+        if (key not in self.last_starts):
+            self.last_starts[key] = -1
+            for y in range(self.Y - len_y, -1, -1):
+                x = next((x for x in range(self.X - len_x, -1, -1) if self.wallsIn(x, y, len_x, len_y) == 0), None)
+                if (x is not None):
+                    self.last_starts[key] = x + y*self.X
+                    break
+        return self.last_starts[key]
+
+    def nextTall(self, len_y):
+        # next_tall[i] is the index of the first field from the field i on, in its row, with free_down
+        # of at least len_y - the first column a box that tall can start in; the end of the row if there
+        # is none. Calculated once for every box height.
+        if (len_y not in self.next_tall):
+            next_tall = [0] * (self.X*self.Y)
+            for y in range(self.Y):
+                row = y*self.X
+                tall = row + self.X
+                for i in range(row + self.X - 1, row - 1, -1):
+                    if (self.free_down[i] >= len_y): tall = i
+                    next_tall[i] = tall
+            self.next_tall[len_y] = next_tall
+        return self.next_tall[len_y]
+
 class Magazine:
     def __init__(self, X, Y):
         self.X = X
@@ -29,6 +119,12 @@ class Magazine:
         self.fill_factor = 0.0
         self.wall_blocks_count = 0
         self.next_box_index = 0   # index of field where trying to insert a next box will begin
+        self.placed_boxes = []    # (start index, len_x, len_y) of the boxes inserted so far
+        # Work of the position search, for profiling: addBox calls, positions checked
+        # and rows of the box checked for conflicts at them.
+        self.add_box_calls = 0
+        self.scan_steps = 0
+        self.conflict_checks = 0
 
         self.fields = []
         x = 0
@@ -39,6 +135,18 @@ class Magazine:
             if (x == X):
                 x = 0
                 y += 1
+
+        ## Free-space index.
+        # A box field can't be put in a field which is a wall, a box, or is next to a box field:
+        # on the left, on the right, below, or in one of the two lower corners.
+        # blocked[i] counts the reasons why the field i can't take a box field (wall + inserted boxes).
+        # free_run[i] is the number of not blocked fields from the field i to the right, in its row.
+        self.blocked = [0] * (self.X*self.Y)
+        self.free_run = [self.X - (i % self.X) for i in range(self.X*self.Y)]
+        # Rows whose free runs have to be recalculated after changing walls.
+        self.dirty_rows = set()
+        # Calculated before the first box is inserted after changing walls.
+        self.wall_map = None
     
     def setFieldStateToWall(self, x, y):
         self.__setFieldState(x, y, FieldState.WALL)
@@ -55,8 +163,23 @@ class Magazine:
         assert (y <= self.Y)
         oldstate = self.fields[x + y*self.X].state
         self.fields[x + y*self.X].state = state
+        if (oldstate != state and FieldState.WALL in (oldstate, state)):
+            self.blocked[x + y*self.X] += 1 if state == FieldState.WALL else -1
+            self.dirty_rows.add(y)
+            self.wall_map = None
         return oldstate
 
+    # Set all the walls at once: walls[y][x] tells if the (x, y) field is a wall, the other fields become empty.
+    def setWalls(self, walls):
+        for y, row in enumerate(walls):
+            for x, wall in enumerate(row):
+                if (wall): self.setFieldStateToWall(x, y)
+                elif (self.fields[x + y*self.X].state == FieldState.WALL): self.setFieldStateToEmpty(x, y)
+
+    # One byte for every field, in the order of the field indexes: 1 for a wall, 0 otherwise.
+    def getWalls(self):
+        return bytes(f.state == FieldState.WALL for f in self.fields)
+
     def getFieldState(self, x, y):
         assert (x >= 0)
         assert (x <= self.X)
@@ -72,106 +195,131 @@ class Magazine:
         return state
 
     def addBox(self, box):
-        # First, mark fields which will be occupied by the box and see if you can
-        # insert it. If not, change the starting point and try again. Keep it until
-        # you insert the box or the starting point is out of range.
-        box_fields = []
-        start_index = self.next_box_index
-        while (start_index < len(self.fields)):
-            start_y = start_index // self.X
-            start_x = start_index - (start_y*self.X)
-            if (start_y + box.len_y > self.Y):
-                # The box won't fit 
-                return False 
-            if (start_x + box.len_x > self.X):
-                # Try in the next row
-                start_index += (self.X - start_x)
+        if (self.dirty_rows): self.__updateDirtyRows()
+        if (self.wall_map is None):
+            self.wall_map = WallMap(self.X, self.Y, [f.state == FieldState.WALL for f in self.fields])
+        self.add_box_calls += 1
+
+        index = self.__findPosition(box)
+        if (index < 0):
+            # Starting point out of range - this box won't fit in the magazine
+            return False
+
+        # Insert the box in the found position
+        self.__placeBox(index, box.len_x, box.len_y, 1)
+        # Update fill factor
+        self.fill_factor += box.len_x*box.len_y/(len(self.fields) - self.wall_blocks_count)
+        # Move the next box starting point
+        self.next_box_index = index + box.len_x + 1
+        self.placed_boxes.append((index, box.len_x, box.len_y))
+        return True
+
+    def __findPosition(self, box):
+        # Look for the first position, from the starting point on, where every row of the box
+        # has a free run at least as long as the box. A too short run ends with a blocked field,
+        # so no position up to that field can take the box - the search jumps past it.
+        # Returns the index of the position, -1 if there is none.
+        # Positions after the last one without walls under the box are never checked.
+        last_start = self.wall_map.lastStart(box.len_x, box.len_y)
+        if (self.next_box_index > last_start):
+            return -1
+        free_down = self.wall_map.free_down
+        next_tall = self.wall_map.nextTall(box.len_y)
+        start_y = self.next_box_index // self.X
+        start_x = self.next_box_index - (start_y*self.X)
+        found = -1
+        steps = 0
+        checks = 0
+        for y in range(start_y, last_start // self.X + 1):
+            x = start_x if y == start_y else 0
+            while (x + box.len_x <= self.X):
+                index = x + y*self.X
+                if (index > last_start):
+                    break
+                steps += 1
+                if (free_down[index] < box.len_y):
+                    # A wall in this column below - the box can't start here nor in the next columns
+                    # with a wall too close below, jump to the first one with enough room.
+                    x = next_tall[index] - y*self.X
+                    continue
+                for i in range(box.len_y):
+                    run = self.free_run[index + i*self.X]
+                    if (run < box.len_x):
+                        checks += i + 1
+                        x += run + 1
+                        break
+                else:
+                    checks += box.len_y
+                    found = index
+                    break
+            else:
                 continue
+            break
 
-            can_be_inserted = True
-
-            for i in range(box.len_y):
-                index = start_x + self.X*(start_y + i)
-                for j in range (box.len_x):
-                    if (self.__checkIfFieldIsConflicting(index)):
-                        start_index += 1
-                        can_be_inserted = False
-                        break # inner for loop            
-  
-                    # This field is not conflicting - mark it
-                    box_fields.append(index)
-                    index += 1
-
-                if (not can_be_inserted):
-                    box_fields.clear()
-                    break # outer for loop
-
-            if (can_be_inserted):
-                # Insert the box in the marked fields
-                for i in box_fields:
-                    self.fields[i].state = FieldState.BOX
-                # Update fill factor
-                self.fill_factor += len(box_fields)/(len(self.fields) - self.wall_blocks_count)
-                # Move the next box starting point
-                self.next_box_index = start_index + box.len_x + 1
-                
-                return True
-
-        # Starting index out of range - this box won't fit in the magazine
-        return False 
-
-    def __checkIfFieldIsConflicting(self, index):
-        # Check same field conflicts and (x-1, y), (x+1, y), (x, y-1) neighbors conflicts
-        #
-        if (
-            self.fields[index].state == FieldState.WALL
-            or self.fields[index].state == FieldState.BOX
-            or (self.fields[index-1].state == FieldState.BOX and index % self.X != 0)
-            or (index >= self.X and self.fields[index - self.X].state == FieldState.BOX)
-            or (index+1 < len(self.fields) and self.fields[index+1].state == FieldState.BOX
-                and (index+1) % self.X != 0
-                )
-        ):
-            return True
-
-        # Check corner conflicts
-        #
-        if (index >= self.X): # at least second row
-            
-            if (index % self.X != 0): # not at the left edge
-
-                # Check conflict at the left-bottom corner of the box
-                if (self.fields[index - self.X - 1].state == FieldState.BOX
-                    and self.fields[index-1] != FieldState.WALL
-                    and self.fields[index-self.X] != FieldState.WALL
-                ):
-                    return True
-
-            if ((index+1) % self.X != 0): # not at the right edge
-
-                # Check conflict at the right-bottom corner of the box
-                if (self.fields[index - self.X + 1].state == FieldState.BOX
-                    and self.fields[index+1] != FieldState.WALL
-                    and self.fields[index-self.X] != FieldState.WALL
-                ):
-                    return True
-        
-        # No conflicts
-        return False
+        self.scan_steps += steps
+        self.conflict_checks += checks
+        return found
 
-    def removeAllBoxes(self):
-        self.fill_factor = 0.0
-        self.next_box_index = 0
-        for i in range (self.X*self.Y):
-            if (self.fields[i].state == FieldState.BOX):
-                self.fields[i].state = FieldState.EMPTY
+    # Insert (change = 1) or remove (change = -1) the box fields and update the free-space index.
+    def __placeBox(self, start_index, len_x, len_y, change):
+        state = FieldState.BOX if change > 0 else FieldState.EMPTY
+        start_y = start_index // self.X
+        start_x = start_index - start_y*self.X
+        for i in range(len_y):
+            index = start_index + i*self.X
+            for j in range(len_x):
+                self.fields[index + j].state = state
 
+        # Fields blocked by the box: the box and the fields on its left, right and below.
+        from_x = max(start_x - 1, 0)
+        to_x = min(start_x + len_x, self.X - 1)
+        for y in range(start_y, min(start_y + len_y + 1, self.Y)):
+            for i in range(from_x + y*self.X, to_x + y*self.X + 1):
+                self.blocked[i] += change
+            self.__updateFreeRuns(y, from_x, to_x)
 
+    def __updateFreeRuns(self, y, from_x, to_x):
+        # Recalculate the free runs of the fields from to_x down to from_x, and further to the left
+        # up to the first blocked field - runs on its left don't depend on the fields on its right.
+        row = y*self.X
+        run = self.free_run[row + to_x + 1] if to_x + 1 < self.X else 0
+        for i in range(row + to_x, row - 1, -1):
+            if (self.blocked[i]):
+                if (i < row + from_x): break
+                run = 0
+            else:
+                run += 1
+            self.free_run[i] = run
 
-        
-     
-        
-        
+    def __updateDirtyRows(self):
+        for y in self.dirty_rows:
+            self.__updateFreeRuns(y, 0, self.X - 1)
+        self.dirty_rows.clear()
 
+    def removeAllBoxes(self):
+        # Only the fields of the inserted boxes are touched.
+        for placed in self.placed_boxes:
+            self.__placeBox(*placed, -1)
+        self.fill_factor = 0.0
+        self.next_box_index = 0
+        self.placed_boxes = []
 
+    # The state of the inserted boxes, which can be brought back by restoreState().
+    def saveState(self):
+        return (self.fill_factor, self.next_box_index, tuple(self.placed_boxes))
 
+    def restoreState(self, state):
+        # Only the fields of the boxes inserted now and in the saved state are changed.
+        # If the saved boxes are the first ones inserted now, only the boxes inserted after them are removed.
+        saved_count = len(state[2])
+        if (saved_count <= len(self.placed_boxes) and tuple(self.placed_boxes[:saved_count]) == state[2]):
+            for placed in self.placed_boxes[saved_count:]:
+                self.__placeBox(*placed, -1)
+            self.fill_factor, self.next_box_index = state[0], state[1]
+            del self.placed_boxes[saved_count:]
+            return
+        self.removeAllBoxes()
+        self.fill_factor, self.next_box_index, placed_boxes = state
+        self.placed_boxes = list(placed_boxes)
+        for placed in self.placed_boxes:
+            self.__placeBox(*placed, 1)
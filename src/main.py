@@ -1,7 +1,8 @@
 """
 main.py
 Startup file of the 'Magazine' project.
-Default algorithm parameters are set here.
+Starts the GUI with the default algorithm parameters from solver.py.
+For the headless batch mode see cli.py.
 04/2020 Kamil Zacharczuk
 """
 from magazine import *
@@ -10,12 +11,8 @@ from gui import *
 from solver import *
 
 def main():
-    default_population_size = 7
-    default_iterations = 20
-    default_mutation_probability = 1/30
-
     solver = Solver()
-    gui = GUI(solver, default_population_size, default_iterations, default_mutation_probability)
+    gui = GUI(solver, DEFAULT_POPULATION_SIZE, DEFAULT_ITERATIONS, DEFAULT_MUTATION_PROBABILITY)
 
     gui.displayGUI()
 
@@ -0,0 +1,62 @@
+"""
+metrics.py
+Observers of the genetic algorithm run. performAlgorithm reports to an observer
+after every generation, with a dict of the generation metrics:
+    generation                   - generation number, from 1
+    crossover_time, mutation_time,
+    evaluation_time, selection_time,
+    local_search_time            - seconds spent in each step of the generation
+    evaluations, decodes         - fitness values requested and genotypes actually decoded
+    cache_hits                   - fitness values taken from the cache (0 without the cache)
+    best, mean, worst            - fitness values of the new population
+    diversity                    - distinct genotypes in the new population / population size
+and once at the end of the run, with the totals (generations, evaluations, decodes, cache_hits, best,
+and the summed step times) and stop_reason - why the run ended (see algorithm.StoppingCriteria),
+"solution_cache" when the solver answered from its solution cache without running any generation.
+"""
+import json
+
+class GenerationObserver:
+    # Does nothing - the default observer and the base class for the others.
+    def onGeneration(self, metrics):
+        pass
+
+    def onFinish(self, summary):
+        pass
+
+class MemoryCollector(GenerationObserver):
+    # Keeps all the reports in memory.
+    def __init__(self):
+        self.generations = []
+        self.summary = None
+
+    def onGeneration(self, metrics):
+        self.generations.append(metrics)
+
+    def onFinish(self, summary):
+        self.summary = summary
+
+class JsonlObserver(GenerationObserver):
+    # Writes every report as one JSON line to a file (path or file object).
+    # Additional fields, e.g. the job id, are added to every line.
+    def __init__(self, file, **fields):
+        self.owns_file = isinstance(file, str)
+        # Line buffered, so lines of several processes appending to one file don't get mixed.
+        self.file = open(file, "a", buffering=1) if self.owns_file else file
+        self.fields = fields
+
+    def onGeneration(self, metrics):
+        self.__write(dict(self.fields, event="generation", **metrics))
+
+    def onFinish(self, summary):
+        self.__write(dict(self.fields, event="finish", **summary))
+        self.close()
+
+    # Closes the file opened by the observer, flushes a given one. Safe to call more than once,
+    # e.g. after a run which failed before onFinish.
+    def close(self):
+        if (self.owns_file): self.file.close()
+        elif (not self.file.closed): self.file.flush()
+
+    def __write(self, record):
+        self.file.write(json.dumps(record) + "\n")
@@ -0,0 +1,59 @@
+"""
+parallel.py
+Parallel fitness evaluation. Genotypes of a generation are spread across
+a pool of worker processes. Every worker keeps its own copy of the magazine
+(with the walls already set) and of the boxes, so only the genotypes,
+encoded as arrays of box indexes, travel to the workers.
+"""
+import array
+from concurrent.futures import ProcessPoolExecutor
+from incremental import PrefixDecoder
+
+# State of a worker process, set once by the pool initializer.
+_worker_magazine = None
+_worker_boxes = None
+_worker_decoder = None
+
+def _initWorker(magazine, boxes, incremental):
+    global _worker_magazine, _worker_boxes, _worker_decoder
+    _worker_magazine = magazine
+    _worker_boxes = boxes
+    _worker_magazine.removeAllBoxes()
+    if (incremental):
+        _worker_decoder = PrefixDecoder(_worker_magazine, _worker_boxes)
+
+def _decodeGenotypes(genotypes):
+    if (_worker_decoder is not None):
+        return _worker_decoder.evaluate(genotypes)
+
+    result = []
+    for genotype in genotypes:
+        for i in genotype:
+            _worker_magazine.addBox(_worker_boxes[i])
+        result.append(_worker_magazine.fill_factor)
+        _worker_magazine.removeAllBoxes()
+
+    return result
+
+class ParallelEvaluator:
+    def __init__(self, magazine, boxes, workers, incremental=False):
+        self.workers = workers
+        self.typecode = "H" if len(boxes) <= 0xFFFF else "L"
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                            initargs=(magazine, boxes, incremental))
+
+    def evaluate(self, genotypes):
+        if (not genotypes): return []
+
+        encoded = [array.array(self.typecode, g) for g in genotypes]
+        # One chunk of genotypes per worker to keep the number of round-trips low.
+        chunk_size = -(-len(encoded) // self.workers)
+        chunks = [encoded[i:i+chunk_size] for i in range(0, len(encoded), chunk_size)]
+
+        result = []
+        for values in self.executor.map(_decodeGenotypes, chunks):
+            result.extend(values)
+        return result
+
+    def close(self):
+        self.executor.shutdown()
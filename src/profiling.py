@@ -0,0 +1,109 @@
+"""
+profiling.py
+Profiles of solve runs (see the profilePath option of Solver.solve).
+A path ending with .folded or .collapsed gets the stacks sampled every few milliseconds
+in the collapsed format ("outer;inner count" lines) read by flamegraph.pl, speedscope and similar
+tools; this adds almost nothing to the run time. Any other path gets the pstats file of cProfile,
+with the call counts and the cumulative time of every function (python3 -m pstats, snakeviz),
+at the cost of a slower run.
+Only the process and the thread calling solve are profiled, not the decoding workers or the islands.
+Besides the profile the counters of the position search of the magazine are reported
+(add_box_calls, scan_steps and conflict_checks, see magazine.py and bitmap.py), in total and per addBox call.
+They are left out when the genotypes are decoded elsewhere - with batch evaluation, decoding workers
+or islands - as they would count only the decoding of the winner then.
+"""
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.005
+COLLAPSED_SUFFIXES = (".folded", ".collapsed")
+MAGAZINE_COUNTERS = ("add_box_calls", "scan_steps", "conflict_checks")
+
+class SamplingProfiler:
+    # Takes the stack of the thread which started it every interval seconds, from a thread of its own.
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread_id = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.__run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write("{} {}\n".format(stack, count))
+
+    def __run(self):
+        names = {}
+        while (not self.stop_event.wait(self.interval)):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while (frame is not None):
+                code = frame.f_code
+                if (code not in names):
+                    names[code] = "{}:{}".format(os.path.basename(code.co_filename),
+                                                 getattr(code, "co_qualname", code.co_name))
+                stack.append(names[code])
+                frame = frame.f_back
+            del frame
+            if (stack):
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+class TracingProfiler:
+    # cProfile of the thread which started it.
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+class SolveProfile:
+    # Profiles the code run in its with block and reports to the stats dict:
+    # stats["profile"] holds the path of the profile and, with counters, the magazine counters of the block.
+    def __init__(self, path, magazine, stats, counters=True):
+        self.path = path
+        self.magazine = magazine
+        self.stats = stats
+        self.counters_reported = counters
+        if (path.endswith(COLLAPSED_SUFFIXES)): self.profiler = SamplingProfiler()
+        else: self.profiler = TracingProfiler()
+
+    def __enter__(self):
+        self.counters = {c: getattr(self.magazine, c) for c in MAGAZINE_COUNTERS}
+        self.profiler.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.profiler.stop()
+        self.profiler.write(self.path)
+        profile = {"path": self.path}
+        if (self.counters_reported):
+            for counter in MAGAZINE_COUNTERS:
+                profile[counter] = getattr(self.magazine, counter) - self.counters[counter]
+            calls = max(profile["add_box_calls"], 1)
+            profile["scan_steps_per_call"] = profile["scan_steps"] / calls
+            profile["conflict_checks_per_call"] = profile["conflict_checks"] / calls
+        if (isinstance(self.profiler, SamplingProfiler)): profile["samples"] = self.profiler.samples
+        self.stats["profile"] = profile
+        return False
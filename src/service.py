@@ -0,0 +1,255 @@
+"""
+service.py
+Long-running local solver service. Jobs in the format of cli.py are sent over a Unix socket
+or a localhost TCP port, queued by priority and solved on a shared pool of worker processes,
+which are started once and keep the solver modules loaded. Progress reports and the results
+are streamed back to the client which sent the job. See client.py for the client library.
+
+Usage: python3 ./src/service.py [--socket PATH | --port N] [-j WORKERS]
+
+Messages are JSON objects, one per line. From the client:
+    {"type": "solve", "job": {...}, "priority": 0, "tag": 1}
+        higher priorities are solved first, equal ones in the order of arrival;
+        the tag (optional, any value) comes back in the "queued" answer
+    {"type": "cancel", "job_id": 3}    a running job stops and returns its best solution so far
+    {"type": "status"}
+From the service:
+    {"type": "queued", "job_id": 3, "tag": 1}
+    {"type": "started", "job_id": 3}
+    {"type": "progress", "job_id": 3, "generation": 5, "best": 0.61, "mean": 0.55, "evaluations_per_second": 812.0}
+    {"type": "result", "job_id": 3, ...}     the result of cli.runJob, with "cancelled": true for jobs
+                                             cancelled before they were started
+    {"type": "status", "queued": 2, "running": 4, "workers": 4}
+    {"type": "error", "message": "...", "tag": 1}   answer to a malformed message, with its tag if any
+Jobs of a client which disconnects are cancelled.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cli
+
+DEFAULT_PORT = 7373
+# Seconds between the progress reports of a job.
+PROGRESS_INTERVAL = 0.2
+# Longest message line accepted, jobs with many boxes can be long.
+MAX_LINE_LENGTH = 64 * 1024 * 1024
+
+def _initWorker():
+    # Import the engines once in every worker, not with every job.
+    import solver
+    try:
+        import numpy
+        import bitmap
+        import vectorized
+    except ImportError:
+        pass
+
+def _warmUp():
+    return os.getpid()
+
+def _solveJob(jobId, job, events, stopEvent):
+    last_report = [0.0]
+    def reportProgress(generation, best, mean, evaluationsPerSecond, placement):
+        now = time.monotonic()
+        if (now - last_report[0] < PROGRESS_INTERVAL): return
+        last_report[0] = now
+        events.put({"type": "progress", "job_id": jobId, "generation": generation, "best": best,
+                    "mean": mean, "evaluations_per_second": evaluationsPerSecond})
+    return cli.runJob(jobId, job, progressCallback=reportProgress, stopEvent=stopEvent)
+
+class ServiceJob:
+    def __init__(self, jobId, job, connection, stopEvent):
+        self.job_id = jobId
+        self.job = job
+        self.connection = connection
+        self.stop_event = stopEvent
+        self.state = "queued"   # "queued", "running" or "cancelled"
+
+class ClientConnection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.jobs = set()
+        self.closed = False
+
+    def send(self, message):
+        if (self.closed): return
+        self.writer.write((json.dumps(message) + "\n").encode())
+
+class SolverService:
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.arrivals = itertools.count()
+        self.server = None
+
+    async def start(self, socketPath=None, host="127.0.0.1", port=DEFAULT_PORT):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.PriorityQueue()
+        # Progress reports of the workers and the results go through one queue, so they come in order.
+        self.manager = multiprocessing.Manager()
+        self.events = self.manager.Queue()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_initWorker)
+        # Start all the workers now, not with the first jobs.
+        await asyncio.gather(*[self.loop.run_in_executor(self.pool, _warmUp) for i in range(self.workers)])
+        self.forwarder = threading.Thread(target=self.__forwardEvents, daemon=True)
+        self.forwarder.start()
+        self.runners = [asyncio.create_task(self.__runJobs()) for i in range(self.workers)]
+
+        if (socketPath is not None):
+            self.server = await asyncio.start_unix_server(self.__handleClient, path=socketPath,
+                                                          limit=MAX_LINE_LENGTH)
+        else:
+            self.server = await asyncio.start_server(self.__handleClient, host, port, limit=MAX_LINE_LENGTH)
+
+    async def serveForever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if (self.server is not None):
+            self.server.close()
+        for job in self.jobs.values():
+            job.stop_event.set()
+        for runner in self.runners:
+            runner.cancel()
+        await self.loop.run_in_executor(None, self.pool.shutdown)
+        self.events.put(None)
+        self.manager.shutdown()
+
+    def __forwardEvents(self):
+        # Runs in a thread - the events of the workers are passed to the event loop.
+        while (True):
+            try:
+                event = self.events.get()
+            except (EOFError, OSError):
+                return
+            if (event is None): return
+            self.loop.call_soon_threadsafe(self.__sendEvent, event)
+
+    def __sendEvent(self, event):
+        job = self.jobs.get(event["job_id"])
+        if (job is None): return
+        job.connection.send(event)
+        if (event["type"] == "result"):
+            self.__forgetJob(job)
+
+    def __forgetJob(self, job):
+        self.jobs.pop(job.job_id, None)
+        job.connection.jobs.discard(job.job_id)
+
+    async def __runJobs(self):
+        while (True):
+            priority, arrival, job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if (job is None or job.state == "cancelled"): continue
+            job.state = "running"
+            job.connection.send({"type": "started", "job_id": job_id})
+            try:
+                result = await self.loop.run_in_executor(self.pool, _solveJob, job_id, job.job, self.events,
+                                                         job.stop_event)
+            except Exception as e:
+                result = {"job": job_id, "id": job.job.get("id", job_id),
+                          "error": "{}: {}".format(type(e).__name__, e)}
+            result.update(type="result", job_id=job_id)
+            # After the progress reports of the job already in the queue.
+            await self.loop.run_in_executor(None, self.events.put, result)
+
+    async def __handleClient(self, reader, writer):
+        connection = ClientConnection(writer)
+        try:
+            while (True):
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break
+                if (not line): break
+                message = None
+                try:
+                    message = json.loads(line)
+                    self.__handleMessage(connection, message)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    error = {"type": "error", "message": "{}: {}".format(type(e).__name__, e)}
+                    if (isinstance(message, dict) and "tag" in message): error["tag"] = message["tag"]
+                    connection.send(error)
+                await writer.drain()
+        finally:
+            connection.closed = True
+            for job_id in list(connection.jobs):
+                self.cancelJob(self.jobs[job_id])
+            writer.close()
+
+    def __handleMessage(self, connection, message):
+        kind = message["type"]
+        if (kind == "solve"):
+            job = message["job"]
+            if (not isinstance(job, dict)): raise TypeError("The job must be an object")
+            job_id = next(self.job_ids)
+            service_job = ServiceJob(job_id, job, connection, self.manager.Event())
+            self.jobs[job_id] = service_job
+            connection.jobs.add(job_id)
+            self.queue.put_nowait((-(float)(message.get("priority", 0)), next(self.arrivals), job_id))
+            connection.send({"type": "queued", "job_id": job_id, "tag": message.get("tag")})
+        elif (kind == "cancel"):
+            job = self.jobs.get(message["job_id"])
+            if (job is not None and job.connection is connection):
+                self.cancelJob(job)
+        elif (kind == "status"):
+            states = [job.state for job in self.jobs.values()]
+            connection.send({"type": "status", "queued": states.count("queued"), "running": states.count("running"),
+                             "workers": self.workers})
+        else:
+            raise ValueError("Unknown message type: " + str(kind))
+
+    def cancelJob(self, job):
+        if (job.state == "queued"):
+            job.state = "cancelled"
+            job.connection.send({"type": "result", "job_id": job.job_id, "job": job.job_id,
+                                 "id": job.job.get("id", job.job_id), "cancelled": True})
+            self.__forgetJob(job)
+        elif (job.state == "running"):
+            # The solver returns the best solution found so far, the result is sent as usual.
+            job.stop_event.set()
+
+async def runService(args):
+    service = SolverService(args.workers)
+    await service.start(args.socket, args.host, args.port)
+    print("Solver service with {} workers listening on {}".format(
+        args.workers, args.socket if args.socket else "{}:{}".format(args.host, args.port)), file=sys.stderr)
+    serving = asyncio.create_task(service.serveForever())
+    # Stopped with SIGTERM the same way as with Ctrl+C, so the workers are shut down.
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+    except (NotImplementedError, AttributeError):
+        pass
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve magazine jobs sent by local clients.")
+    parser.add_argument("--socket", help="Unix socket path, instead of the TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of jobs solved at once")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(runService(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+solutioncache.py
+On-disk cache of the solutions of Solver.solve, shared by all the solve calls and processes
+using the same directory. An entry is keyed by the hash of the magazine shape (size and walls)
+and the hash of the box multiset: an exact hit gives the stored solution without running
+the algorithm, a near hit - the same magazine with mostly the same boxes - gives the stored
+genotypes to start the algorithm from instead of random ones.
+
+Every magazine shape has its own subdirectory with one file per box multiset, holding
+the zlib compressed pickle of the entry. Files are written to a temporary file and renamed,
+so concurrent readers see either the old or the new entry, never a partial one; unreadable
+or vanished files are treated as misses. Hits refresh the modification time of the entry and
+the least recently used entries are removed when the cache grows over its size limit.
+Entries are pickles - use only cache directories written by this program.
+"""
+import array
+import hashlib
+import os
+import pickle
+import random
+import zlib
+from collections import Counter, defaultdict
+
+MAGIC = b"MAGSOL\x01"
+ENTRY_SUFFIX = ".sol"
+# Entries of the magazine compared with the boxes when looking for a near hit, the most recently used first.
+MAX_NEAR_CANDIDATES = 32
+
+def getShapeKey(magazine):
+    digest = hashlib.sha256("{}x{}:".format(magazine.X, magazine.Y).encode("ascii"))
+    digest.update(magazine.getWalls())
+    return digest.hexdigest()[:32]
+
+def getBoxesKey(boxesDimensions):
+    dimensions = array.array("L", [d for b in sorted(boxesDimensions) for d in b])
+    return hashlib.sha256(dimensions.tobytes()).hexdigest()[:32]
+
+# Box indexes in the order of the box dimensions sequence, taking the boxes of every size in their order.
+# Dimensions of boxes not in boxesDimensions are skipped, the boxes not used are appended in the given order.
+def getBoxIndexes(sequence, boxesDimensions, rest=None):
+    boxes_of_size = defaultdict(list)
+    for i in range(len(boxesDimensions) - 1, -1, -1):
+        boxes_of_size[tuple(boxesDimensions[i])].append(i)
+    indexes = [boxes_of_size[d].pop() for d in map(tuple, sequence) if boxes_of_size.get(d)]
+    used = set(indexes)
+    left = [i for i in range(len(boxesDimensions)) if i not in used]
+    if (rest is not None): rest.shuffle(left)
+    return indexes + left
+
+class SolutionCache:
+    def __init__(self, directory, maxBytes=64 << 20, nearOverlap=0.5):
+        self.directory = directory
+        self.max_bytes = maxBytes
+        # Fraction of the boxes which has to be in a stored entry for a near hit.
+        self.near_overlap = nearOverlap
+        os.makedirs(directory, exist_ok=True)
+
+    # Returns ("hit", entry), ("near", entry) or ("miss", None). boxesDimensions are (len_x, len_y) pairs.
+    # entry["genotypes"] are sequences of box dimensions, the best solution first, entry["fill_factor"]
+    # is the fill factor of the best one.
+    def lookup(self, magazine, boxesDimensions):
+        shape_key = getShapeKey(magazine)
+        walls = magazine.getWalls()
+        path = self.__entryPath(shape_key, getBoxesKey(boxesDimensions))
+        entry = self.__load(path)
+        boxes = Counter(map(tuple, boxesDimensions))
+        if (entry is not None and self.__matches(entry, magazine, walls) and Counter(entry["boxes"]) == boxes):
+            self.__touch(path)
+            return ("hit", entry)
+
+        # Near hit - the stored entry of the same magazine sharing the most boxes.
+        best, best_overlap = None, 0
+        for candidate_path in self.__shapeEntries(shape_key)[:MAX_NEAR_CANDIDATES]:
+            candidate = self.__load(candidate_path)
+            if (candidate is None or not self.__matches(candidate, magazine, walls)): continue
+            overlap = sum((Counter(candidate["boxes"]) & boxes).values())
+            if (overlap > best_overlap):
+                best, best_overlap = (candidate_path, candidate), overlap
+        if (best is not None and best_overlap >= self.near_overlap * len(boxesDimensions)):
+            self.__touch(best[0])
+            return ("near", best[1])
+        return ("miss", None)
+
+    # Store the solutions - sequences of box dimensions, the best first - of the magazine and the boxes.
+    def store(self, magazine, boxesDimensions, genotypes, fillFactor):
+        shape_key = getShapeKey(magazine)
+        path = self.__entryPath(shape_key, getBoxesKey(boxesDimensions))
+        entry = {
+            "width": magazine.X, "height": magazine.Y, "walls": magazine.getWalls(),
+            "boxes": sorted(map(tuple, boxesDimensions)), "fill_factor": fillFactor,
+            "genotypes": [[tuple(d) for d in g] for g in genotypes],
+        }
+        old = self.__load(path)
+        if (old is not None and old["fill_factor"] > fillFactor): return
+        data = MAGIC + zlib.compress(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A name of its own for every writer, the rename replaces the entry at once.
+        temp_path = "{}.{}.{}.tmp".format(path, os.getpid(), random.getrandbits(32))
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        finally:
+            if (os.path.exists(temp_path)): os.remove(temp_path)
+        self.evict()
+
+    # Remove the least recently used entries until the cache fits in its size limit.
+    def evict(self):
+        entries = []
+        total = 0
+        for shape in os.scandir(self.directory):
+            if (not shape.is_dir()): continue
+            for entry in os.scandir(shape.path):
+                if (not entry.name.endswith(ENTRY_SUFFIX)): continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if (total <= self.max_bytes): break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def __entryPath(self, shapeKey, boxesKey):
+        return os.path.join(self.directory, shapeKey, boxesKey + ENTRY_SUFFIX)
+
+    def __shapeEntries(self, shapeKey):
+        # Entry files of the magazine, the most recently used first.
+        entries = []
+        try:
+            for entry in os.scandir(os.path.join(self.directory, shapeKey)):
+                if (entry.name.endswith(ENTRY_SUFFIX)):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            return []
+        return [path for mtime, path in sorted(entries, reverse=True)]
+
+    def __load(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if (not data.startswith(MAGIC)): return None
+            return pickle.loads(zlib.decompress(data[len(MAGIC):]))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+
+    def __matches(self, entry, magazine, walls):
+        # The hash of the shape is only a file name, the walls are compared too.
+        return entry["width"] == magazine.X and entry["height"] == magazine.Y and entry["walls"] == walls
+
+    def __touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
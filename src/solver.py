@@ -5,34 +5,229 @@ from the GUI, translates it to the form known by the algorithm engine,
 invokes the algorithm and translates its output for the GUI.
 04/2020 Kamil Zacharczuk
 """
+import random
+from contextlib import nullcontext
 from magazine import *
 from algorithm import *
 
+# Default algorithm parameters.
+DEFAULT_POPULATION_SIZE = 7
+DEFAULT_ITERATIONS = 20
+DEFAULT_MUTATION_PROBABILITY = 1/30
+
+# Magazines with more fields are solved with the "bitmap" engine, unless another engine is given.
+BITMAP_ENGINE_FIELDS = 64*64
+
+# Magazine engines the solver can decode the genotypes with.
+# "fields" - list of Field objects (magazine.Magazine), "bitmap" - NumPy array (bitmap.BitmapMagazine).
+def getMagazineEngine(engine):
+    if (engine == "fields"):
+        return Magazine
+    if (engine == "bitmap"):
+        from bitmap import BitmapMagazine
+        return BitmapMagazine
+    raise ValueError("Unknown magazine engine: " + str(engine))
+
+# The engine for a magazine of the given number of fields: "bitmap" for layouts and big magazines,
+# if NumPy is there, "fields" otherwise.
+def getDefaultEngine(fieldsCount, isLayout=False):
+    if (isLayout): return "bitmap"
+    if (fieldsCount > BITMAP_ENGINE_FIELDS):
+        try:
+            import numpy
+            return "bitmap"
+        except ImportError:
+            pass
+    return "fields"
+
 class Solver:
-    def solve(self, magazineShape, boxesDimensions, populationSize, iterations, mutationProbability):
-        mag_x = len(magazineShape)
-        mag_y = len(magazineShape[0])
-        magazine = Magazine(mag_x, mag_y)
+    def __init__(self):
+        # Fitness cache of the last solve() call, its hits and misses counters can be read after solving.
+        self.fitness_cache = None
+        # Numbers of generations, fitness evaluations and decodes of the last solve() call
+        # and the reason why its algorithm stopped.
+        self.stats = {}
+        # (box index, x, y) of every box inserted in the winner solution of the last solve() call.
+        self.placement = []
 
-        for x in range(mag_x):
-            for y in range(mag_y):
-                if (magazineShape[x][y] == "wall"):
-                    magazine.setFieldStateToWall(x,y)
+    def solve(self, magazineShape, boxesDimensions, populationSize, iterations, mutationProbability,
+              engine=None, cacheSize=4096, workers=1, incremental=False, batchOperators=False,
+              progressCallback=None, stopEvent=None, observer=None, islands=1, migrationInterval=5,
+              topology="ring", stallGenerations=None, targetFitness=None, timeBudget=None, stopAtUpperBound=True,
+              seed=None, checkpointPath=None, checkpointInterval=10, resumeFrom=None, batchEvaluation=False,
+              offspringCount=None, parentSelection="tournament", elitism=None, localSearch=0, localSearchMoves=32,
+              solutionCache=None, profilePath=None):
+        # progressCallback(generation, best fitness, mean fitness, evaluations per second, placement)
+        # gets the placement of the best solution of every generation, in the form of self.placement.
+        # Setting stopEvent stops the algorithm and the best solution found so far is returned.
+        # observer gets the metrics of every generation (see metrics.py).
+        # With more than one island the island model is run (see island.py); the callback and stopEvent
+        # act at the end of every migration interval then, the observer and workers are not used.
+        # The algorithm may stop before all the iterations are run: after stallGenerations generations
+        # without improvement, at targetFitness, at the upper bound of the fill factor or after timeBudget
+        # seconds (see algorithm.StoppingCriteria); self.stats["stop_reason"] tells which criterion fired.
+        # The islands check the criteria at the end of every migration interval.
+        # With a seed the run is repeatable, without it the random module is used.
+        # With a checkpointPath the run is saved every checkpointInterval generations and can be
+        # continued with resume(); resumeFrom is the loaded checkpoint to continue from (see checkpoint.py).
+        # The islands are not checkpointed.
+        # Instead of the magazineShape a layout (2D NumPy array, see layout.py) can be given,
+        # the magazine is returned as a layout then. Without an engine layouts and magazines of more than
+        # BITMAP_ENGINE_FIELDS fields are solved with the "bitmap" engine, the others with "fields".
+        # batchEvaluation decodes the whole population at once in NumPy arrays (see batch.py),
+        # worth it for large populations on a single core.
+        # offspringCount, parentSelection and elitism choose the parents and the survivors of every
+        # generation (see algorithm.performAlgorithm); by default every pair of the population is crossed.
+        # With localSearch that many best genotypes of every generation are improved by localSearchMoves
+        # moves of single boxes (see localsearch.py).
+        # solutionCache (solutioncache.SolutionCache or its directory) gives the stored solution of the same
+        # magazine and boxes without running the algorithm, or starts it from the stored solutions of
+        # the same magazine with similar boxes; self.stats["solution_cache"] is "hit", "near" or "miss".
+        # A hit runs no generations: stop_reason is "solution_cache" and the observer gets only the summary.
+        # With a profilePath the run is profiled and the profile written there, as collapsed stacks
+        # for paths ending with .folded or .collapsed, as pstats otherwise; self.stats["profile"]
+        # holds the counters of the position search, unless the genotypes are decoded elsewhere (see profiling.py).
+        is_layout = not isinstance(magazineShape, list)
+        if (is_layout):
+            mag_y, mag_x = magazineShape.shape
+            if (engine is None): engine = getDefaultEngine(magazineShape.size, True)
+            magazine = getMagazineEngine(engine)(mag_x, mag_y)
+            magazine.setWalls(magazineShape == FieldState.WALL.value)
+        else:
+            mag_x = len(magazineShape)
+            mag_y = len(magazineShape[0])
+            if (engine is None): engine = getDefaultEngine(mag_x*mag_y)
+            magazine = getMagazineEngine(engine)(mag_x, mag_y)
+
+            for x in range(mag_x):
+                for y in range(mag_y):
+                    if (magazineShape[x][y] == "wall"):
+                        magazine.setFieldStateToWall(x,y)
 
         boxes = []
         for b in boxesDimensions:
             boxes.append(Box(b[0], b[1]))
 
-        # Run the algorithm.
-        winner = performAlgorithm(magazine, boxes, (int)(populationSize), (int)(iterations),
-                                  (float)(mutationProbability))
+        # Run the algorithm. Cache size 0 turns the fitness cache off.
+        self.fitness_cache = FitnessCache(cacheSize) if cacheSize > 0 else None
+        self.stats = {}
+        callback = None
+        if (progressCallback is not None):
+            def callback(generation, best, mean, evaluationsPerSecond, genotype):
+                placement = self.__decode(magazine, boxes, genotype)
+                magazine.removeAllBoxes()
+                progressCallback(generation, best, mean, evaluationsPerSecond, placement)
+        rng = random.Random(seed) if seed is not None else random
+        if (offspringCount is not None):
+            offspringCount = (int)(offspringCount)
+            if (offspringCount < 0):
+                raise ValueError("The offspring count cannot be negative: " + str(offspringCount))
+        if (elitism is not None): elitism = (int)(elitism)
+
+        cache_result = None
+        initial_population = None
+        final_population = None
+        if (isinstance(solutionCache, str)):
+            from solutioncache import SolutionCache
+            solutionCache = SolutionCache(solutionCache)
+        if (solutionCache is not None and boxes and resumeFrom is None):
+            from solutioncache import getBoxIndexes
+            cache_result, cached = solutionCache.lookup(magazine, boxesDimensions)
+            self.stats["solution_cache"] = cache_result
+            if (cache_result == "near"):
+                # The stored solutions with the boxes not in them appended in random order.
+                initial_population = [getBoxIndexes(g, boxesDimensions, rng) for g in cached["genotypes"]]
+            final_population = []
+
+        profile = nullcontext()
+        if (profilePath is not None):
+            from profiling import SolveProfile
+            # The magazine decodes all the genotypes only in this process and without batch evaluation.
+            profile = SolveProfile(profilePath, magazine, self.stats,
+                                   not batchEvaluation and workers <= 1 and islands <= 1)
+        with profile:
+            if (cache_result == "hit"):
+                winner = getBoxIndexes(cached["genotypes"][0], boxesDimensions)
+                self.stats.update(generations=0, evaluations=0, decodes=0, stop_reason="solution_cache")
+            elif (islands > 1):
+                if (checkpointPath is not None or resumeFrom is not None):
+                    raise ValueError("The island model runs cannot be checkpointed")
+                # Every island has its own fitness cache.
+                self.fitness_cache = None
+                from island import performIslandAlgorithm
+                winner = performIslandAlgorithm(
+                    magazine, boxes, (int)(populationSize), (int)(iterations),
+                    mutationProbability=(float)(mutationProbability), islands=(int)(islands),
+                    migrationInterval=(int)(migrationInterval), migrants=1, topology=topology, cacheSize=cacheSize,
+                    incremental=incremental, batchOperators=batchOperators, stats=self.stats, rng=rng,
+                    batchEvaluation=batchEvaluation, offspringCount=offspringCount, parentSelection=parentSelection,
+                    elitism=elitism, localSearch=(int)(localSearch), localSearchMoves=(int)(localSearchMoves),
+                    stallGenerations=stallGenerations, targetFitness=targetFitness, timeBudget=timeBudget,
+                    stopAtUpperBound=stopAtUpperBound, progressCallback=callback, stopEvent=stopEvent)
+            else:
+                winner = performAlgorithm(
+                    magazine, boxes, (int)(populationSize), (int)(iterations),
+                    mutationProbability=(float)(mutationProbability), fitnessCache=self.fitness_cache,
+                    workers=(int)(workers), incremental=incremental, batchOperators=batchOperators,
+                    stats=self.stats, progressCallback=callback, stopEvent=stopEvent, observer=observer,
+                    stallGenerations=stallGenerations, targetFitness=targetFitness, timeBudget=timeBudget,
+                    stopAtUpperBound=stopAtUpperBound, rng=rng, checkpointPath=checkpointPath,
+                    checkpointInterval=(int)(checkpointInterval), resumeFrom=resumeFrom,
+                    batchEvaluation=batchEvaluation, offspringCount=offspringCount, parentSelection=parentSelection,
+                    elitism=elitism, localSearch=(int)(localSearch), localSearchMoves=(int)(localSearchMoves),
+                    initialPopulation=initial_population, finalPopulation=final_population,
+                    checkpointLayout=is_layout)
 
-        # Check the fill factor for the winner solution.
-        for box in winner:
-            magazine.addBox(box)
+            # Check the fill factor for the winner solution.
+            self.placement = self.__decode(magazine, boxes, winner)
+        if (cache_result == "hit" and observer is not None):
+            observer.onFinish({"crossover_time": 0.0, "mutation_time": 0.0, "evaluation_time": 0.0,
+                               "selection_time": 0.0, "local_search_time": 0.0, "generations": 0,
+                               "evaluations": 0, "decodes": 0, "cache_hits": 0, "best": magazine.fill_factor,
+                               "stop_reason": "solution_cache"})
+        # Cancelled runs and runs cut short by the time budget are not stored: an exact hit would answer
+        # every later job of the instance with the truncated solution.
+        if (cache_result in ("near", "miss") and self.stats.get("stop_reason") not in ("cancelled", "time_budget")):
+            solutions = final_population if final_population else [winner]
+            solutionCache.store(magazine, boxesDimensions, [[boxesDimensions[i] for i in g] for g in solutions],
+                                magazine.fill_factor)
+
+        if (is_layout):
+            layout = magazineShape.copy()
+            layout[layout == FieldState.BOX.value] = FieldState.EMPTY.value
+            for i, x, y in self.placement:
+                layout[y:y+boxes[i].len_y, x:x+boxes[i].len_x] = FieldState.BOX.value
+            return (layout, magazine.fill_factor)
 
         for x in range(mag_x):
             for y in range(mag_y):
                 magazineShape[x][y] = magazine.getFieldState(x,y)
 
-        return (magazineShape, magazine.fill_factor)
\ No newline at end of file
+        return (magazineShape, magazine.fill_factor)
+
+    # Continue the run saved in the checkpoint file, which is further updated by it.
+    # The instance and the parameters are taken from the checkpoint, iterations can be raised to extend the run.
+    # Other options are passed to solve(); batchOperators and the selection options default to the ones
+    # of the saved run, any other values make the rest of the run differ from the original one.
+    def resume(self, checkpointPath, iterations=None, **options):
+        from checkpoint import loadCheckpoint, getCheckpointInstance
+        checkpoint = loadCheckpoint(checkpointPath)
+        shape, boxesDimensions = getCheckpointInstance(checkpoint)
+        options.setdefault("batchOperators", checkpoint["batch_operators"])
+        for option, key in (("offspringCount", "offspring_count"), ("parentSelection", "parent_selection"),
+                            ("elitism", "elitism"), ("localSearch", "local_search"),
+                            ("localSearchMoves", "local_search_moves")):
+            if (key in checkpoint): options.setdefault(option, checkpoint[key])
+        return self.solve(shape, boxesDimensions, checkpoint["population_size"],
+                          iterations if iterations is not None else checkpoint["iterations"],
+                          checkpoint["mutation_probability"], checkpointPath=checkpointPath,
+                          resumeFrom=checkpoint, **options)
+
+    # Insert the boxes of the genotype into the magazine and return their (box index, x, y).
+    def __decode(self, magazine, boxes, genotype):
+        placement = []
+        for i in genotype:
+            if (magazine.addBox(boxes[i])):
+                start_index = magazine.placed_boxes[-1][0]
+                placement.append((i, start_index % magazine.X, start_index // magazine.X))
+        return placement
@@ -0,0 +1,141 @@
+"""
+tune.py
+Automatic tuning of the algorithm parameters (populationSize, iterations, mutationProbability)
+on a set of representative instances. Every run of a configuration is limited to the time budget,
+so the best configuration is the one reaching the highest mean fill factor within that budget.
+The configurations race with successive halving: in every round all the remaining ones are run
+on more trials (instance and seed pairs) in parallel processes, and only the best 1/eta of them
+go on to the next round, so the poor configurations are dropped after a few cheap runs.
+
+Usage: python3 ./src/tune.py [-j N] [--budget 2] [--populations 5 7 10 20] [--iterations 10 20 50]
+                             [--mutations 0.01 0.033 0.1] [--configs 27] [--out tuned.json] [jobs.json ...]
+The instances are jobs in the format of cli.py (their parameters are ignored, their options are used),
+by default the benchmark instances (see benchmark.py) of the --sizes.
+The best configuration is printed as a JSON line and written to the --out file with the results of every round.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import benchmark
+import cli
+
+def getBenchmarkInstances(sizes, seed):
+    # Jobs of the benchmark instances, generated the same way as by benchmark.runCase.
+    instances = []
+    for kind in benchmark.KINDS:
+        for mix in benchmark.BOX_MIXES:
+            for size in sizes:
+                rng = random.Random("{}-{}-{}-{}".format(seed, kind, mix, size))
+                shape = benchmark.generateMagazineShape(kind, size, rng)
+                walls = [[x, y] for x in range(size) for y in range(size) if shape[x][y] == "wall"]
+                instances.append({"id": "{}/{}/{}".format(kind, mix, size),
+                                  "magazine": {"width": size, "height": size, "walls": walls},
+                                  "boxes": benchmark.generateBoxes(mix, size, rng)})
+    return instances
+
+# The search space - every combination of the values, or count of them drawn at random if there are more.
+def getConfigurations(populations, iterations, mutations, count, rng):
+    configurations = [{"populationSize": p, "iterations": i, "mutationProbability": m}
+                      for p, i, m in itertools.product(populations, iterations, mutations)]
+    if (count is not None and count < len(configurations)):
+        configurations = rng.sample(configurations, count)
+    return configurations
+
+# Trials are (instance index, seed) pairs, interleaved so that the first trials cover all the instances.
+def getTrials(instancesCount, repeats, seed):
+    return [(i, seed + repeat) for repeat in range(repeats) for i in range(instancesCount)]
+
+def runTrial(instance, configuration, trialSeed, budget):
+    job = dict(instance, **configuration)
+    job["options"] = dict(instance.get("options", {}), seed=trialSeed, timeBudget=budget)
+    result = cli.runJob(0, job)
+    if ("error" in result):
+        raise RuntimeError("{}: {}".format(instance.get("id"), result["error"]))
+    return (result["fill_factor"], result["time"])
+
+class Candidate:
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.results = {}   # trial -> (fill factor, time)
+
+    def score(self):
+        # Mean fill factor, the faster of equal ones is better.
+        fill_factors = [r[0] for r in self.results.values()]
+        times = [r[1] for r in self.results.values()]
+        return (sum(fill_factors) / len(fill_factors), -sum(times) / len(times))
+
+    def summary(self):
+        fill_factor, time = self.score()
+        return dict(self.configuration, fill_factor=fill_factor, time=-time, trials=len(self.results))
+
+# Successive halving. Round k runs every remaining candidate on the first firstTrials*eta^k trials,
+# reusing the results of the previous rounds, and keeps the best 1/eta of them.
+# Returns the candidates of the last round, best first, and the summaries of all the rounds.
+def successiveHalving(candidates, instances, trials, budget, executor, eta=2, firstTrials=None, log=None):
+    trials_count = firstTrials if firstTrials is not None else min(len(instances), len(trials))
+    rounds = []
+    while (True):
+        trials_count = min(max(trials_count, 1), len(trials))
+        futures = {}
+        for candidate in candidates:
+            for trial in trials[:trials_count]:
+                if (trial in candidate.results): continue
+                instance, seed = trial
+                futures[(candidate, trial)] = executor.submit(runTrial, instances[instance], candidate.configuration,
+                                                              seed, budget)
+        for (candidate, trial), future in futures.items():
+            candidate.results[trial] = future.result()
+
+        candidates.sort(key=lambda c: c.score(), reverse=True)
+        rounds.append({"trials": trials_count, "candidates": [c.summary() for c in candidates]})
+        if (log is not None):
+            log("Round {}: {} configurations on {} trials, best {}".format(
+                len(rounds), len(candidates), trials_count, json.dumps(candidates[0].summary())))
+        if (len(candidates) == 1 or trials_count == len(trials)):
+            return (candidates, rounds)
+        candidates = candidates[:max(1, math.ceil(len(candidates) / eta))]
+        trials_count *= eta
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the algorithm parameters with successive halving.")
+    parser.add_argument("files", nargs="*", help="job files with the instances, the benchmark instances if none")
+    parser.add_argument("-j", "--parallel", type=int, default=os.cpu_count() or 1, help="number of runs at once")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per run")
+    parser.add_argument("--populations", type=int, nargs="+", default=[5, 7, 10, 20])
+    parser.add_argument("--iterations", type=int, nargs="+", default=[10, 20, 50])
+    parser.add_argument("--mutations", type=float, nargs="+", default=[0.01, 1/30, 0.1])
+    parser.add_argument("--configs", type=int, help="number of configurations drawn from the search space")
+    parser.add_argument("--repeats", type=int, default=3, help="seeds every instance is run with at most")
+    parser.add_argument("--eta", type=int, default=2, help="1/eta of the configurations go on to the next round")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 32], help="sizes of the benchmark instances")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="file to write the results of every round to")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    instances = cli.readJobs(args.files) if args.files else getBenchmarkInstances(args.sizes, args.seed)
+    if (not instances):
+        parser.error("no instances")
+    candidates = [Candidate(c) for c in getConfigurations(args.populations, args.iterations, args.mutations,
+                                                          args.configs, rng)]
+    trials = getTrials(len(instances), max(1, args.repeats), args.seed)
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        candidates, rounds = successiveHalving(candidates, instances, trials, args.budget, executor,
+                                               max(2, args.eta), log=log)
+
+    best = candidates[0].summary()
+    if (args.out is not None):
+        with open(args.out, "w") as f:
+            json.dump({"best": best, "budget": args.budget, "seed": args.seed, "rounds": rounds}, f, indent=1)
+    print(json.dumps(best))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
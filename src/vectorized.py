@@ -0,0 +1,118 @@
+"""
+vectorized.py
+NumPy versions of the genetic operators. They produce all the children
+of a generation at once, working on 2D arrays with one genotype per row.
+Same operators as performCrossover and performMutation in algorithm.py.
+"""
+import random
+import numpy as np
+
+def createGenerator(rng=random, state=None):
+    # Seeded from rng (random.Random or the random module), so seeding it makes the whole run repeatable.
+    # A state saved from bit_generator.state restores the generator instead.
+    generator = np.random.default_rng(rng.getrandbits(64) if state is None else None)
+    if (state is not None): generator.bit_generator.state = state
+    return generator
+
+class CrossoverBuffers:
+    # Arrays of performCrossover for up to childrenCount children, reused in every generation.
+    def __init__(self, childrenCount, genotypeLength, dtype):
+        self.home = np.empty((childrenCount, genotypeLength), dtype=dtype)
+        self.other = np.empty_like(self.home)
+        self.children = np.empty_like(self.home)
+        self.between_loci = np.empty(self.home.shape, dtype=bool)
+        self.before_locus_2 = np.empty(self.home.shape, dtype=bool)
+
+# population is a 2D array of genotypes or a list of them, counts[t] is the number of boxes of type t,
+# every genotype holds the multiset of the box types.
+# pairs are the (first, second) row indexes of the parents to cross, every pair of the population by default.
+# With buffers (CrossoverBuffers) the children are made in them and the returned array is their view.
+def performCrossover(population, counts, rng, pairs=None, buffers=None):
+    parents = np.asarray(population)
+    population_size, genotype_len = parents.shape
+
+    # Every pair of parents gives two twins - rows 2k and 2k+1 of the children array.
+    if (pairs is None):
+        first, second = np.triu_indices(population_size, 1)
+    else:
+        first, second = np.asarray(pairs, dtype=np.int64).reshape(-1, 2).T
+    pairs_count = first.size
+    locus_1 = rng.integers(0, genotype_len, pairs_count)
+    locus_2 = rng.integers(locus_1 + 1, genotype_len + 1)
+
+    if (buffers is None):
+        buffers = CrossoverBuffers(2*pairs_count, genotype_len, parents.dtype)
+    home = buffers.home[:2*pairs_count]
+    other = buffers.other[:2*pairs_count]
+    children = buffers.children[:2*pairs_count]
+    between_loci = buffers.between_loci[:2*pairs_count]
+    before_locus_2 = buffers.before_locus_2[:2*pairs_count]
+    # The parents are gathered straight into the buffers (the clip mode doesn't buffer the output).
+    np.take(parents, first, axis=0, out=home[0::2], mode="clip")
+    np.take(parents, second, axis=0, out=home[1::2], mode="clip")
+    other[0::2] = home[1::2]
+    other[1::2] = home[0::2]
+
+    positions = np.arange(genotype_len)
+    np.greater_equal(positions, np.repeat(locus_1, 2)[:, None], out=between_loci)
+    np.less(positions, np.repeat(locus_2, 2)[:, None], out=before_locus_2)
+    between_loci &= before_locus_2
+    np.copyto(children, home)
+    np.copyto(children, other, where=between_loci)
+
+    repairGenotypes(children, home, np.asarray(counts, dtype=np.int64))
+    return children
+
+def repairGenotypes(children, home, counts):
+    # Occurrences of a type over its count in a child are replaced, in order, by the missing ones,
+    # taken in the order they have in the home parent.
+    rows = np.arange(children.shape[0])[:, None]
+    types_count = counts.size
+
+    # The k-th occurrence of a type in the child is repeated if k >= its count.
+    repeated = occurrenceRanks(children) >= counts[children]
+
+    # The k-th occurrence of a type in the home parent is missing if k < its count - its occurrences in the child.
+    in_child = np.bincount((rows*types_count + children).ravel(), minlength=children.shape[0]*types_count)
+    in_child = in_child.reshape(children.shape[0], types_count)
+    missing = occurrenceRanks(home) < counts[home] - np.minimum(in_child[rows, home], counts[home])
+
+    # Both masks have the same number of True values in every row,
+    # so the row-major order pairs the repeated positions with the missing genes of the same child.
+    children[repeated] = home[missing]
+
+def occurrenceRanks(genotypes):
+    # ranks[r, i] is the number of genes equal to genotypes[r, i] before position i in row r.
+    order = np.argsort(genotypes, axis=1, kind="stable")
+    sorted_genes = np.take_along_axis(genotypes, order, axis=1)
+    positions = np.broadcast_to(np.arange(genotypes.shape[1]), genotypes.shape)
+    run_start = np.zeros(genotypes.shape, dtype=bool)
+    run_start[:, 0] = True
+    run_start[:, 1:] = sorted_genes[:, 1:] != sorted_genes[:, :-1]
+    # Position of the first gene of the run of equal genes, carried forward along the sorted row.
+    first = np.maximum.accumulate(np.where(run_start, positions, 0), axis=1)
+    ranks = np.empty(genotypes.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, positions - first, axis=1)
+    return ranks
+
+def performMutation(children, mutationProbability, rng):
+    # Every gene is swapped with its mirror gene with mutationProbability.
+    # The mutated genes are drawn directly: their number from the binomial distribution,
+    # their positions without replacement.
+    children_count, genotype_len = children.shape
+    genes_count = children_count * genotype_len
+    if (genes_count == 0 or mutationProbability <= 0): return 0
+    mutations = rng.binomial(genes_count, min(mutationProbability, 1.0))
+    mutated = rng.choice(genes_count, mutations, replace=False)
+
+    # A gene and its mirror both drawn swap back, so only pairs drawn an odd number of times are swapped.
+    row, column = np.divmod(mutated, genotype_len)
+    pair = row*genotype_len + np.minimum(column, genotype_len-1-column)
+    pair, count = np.unique(pair, return_counts=True)
+    row, column = np.divmod(pair[count % 2 == 1], genotype_len)
+    mirror = genotype_len-1-column
+    swapped = children[row, column]
+    children[row, column] = children[row, mirror]
+    children[row, mirror] = swapped
+
+    return mutations
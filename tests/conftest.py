@@ -0,0 +1,8 @@
+"""
+conftest.py
+The modules of the project are flat in src/ and import each other by name.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
@@ -0,0 +1,175 @@
+"""
+test_engines.py
+The magazine engines and the batch evaluator against the original per-field placement
+of the boxes, on seeded random magazines with walls: every engine has to give the same
+fill factors and put the boxes in the same fields.
+"""
+import random
+import pytest
+from magazine import Box, FieldState, Magazine
+
+SEEDS = range(40)
+GENOTYPES = 6
+
+class ReferenceMagazine:
+    # The original magazine.Magazine: every field of every position is checked for conflicts one by one.
+    def __init__(self, X, Y, walls):
+        self.X = X
+        self.Y = Y
+        self.states = [FieldState.WALL if w else FieldState.EMPTY for w in walls]
+        self.wall_blocks_count = sum(walls)
+        self.fill_factor = 0.0
+        self.next_box_index = 0
+        self.placed_boxes = []
+
+    def addBox(self, box):
+        box_fields = []
+        start_index = self.next_box_index
+        while (start_index < len(self.states)):
+            start_y = start_index // self.X
+            start_x = start_index - (start_y*self.X)
+            if (start_y + box.len_y > self.Y):
+                return False
+            if (start_x + box.len_x > self.X):
+                start_index += (self.X - start_x)
+                continue
+
+            can_be_inserted = True
+            for i in range(box.len_y):
+                index = start_x + self.X*(start_y + i)
+                for j in range(box.len_x):
+                    if (self.isConflicting(index)):
+                        start_index += 1
+                        can_be_inserted = False
+                        break
+                    box_fields.append(index)
+                    index += 1
+                if (not can_be_inserted):
+                    box_fields.clear()
+                    break
+
+            if (can_be_inserted):
+                for i in box_fields:
+                    self.states[i] = FieldState.BOX
+                self.fill_factor += len(box_fields)/(len(self.states) - self.wall_blocks_count)
+                self.next_box_index = start_index + box.len_x + 1
+                self.placed_boxes.append((start_index, box.len_x, box.len_y))
+                return True
+        return False
+
+    def isConflicting(self, index):
+        # The field, its left, right and upper neighbours and its upper corners can't be box fields.
+        states = self.states
+        X = self.X
+        if (states[index] != FieldState.EMPTY
+                or (index % X != 0 and states[index-1] == FieldState.BOX)
+                or (index >= X and states[index-X] == FieldState.BOX)
+                or ((index+1) % X != 0 and states[index+1] == FieldState.BOX)):
+            return True
+        if (index >= X):
+            if (index % X != 0 and states[index-X-1] == FieldState.BOX):
+                return True
+            if ((index+1) % X != 0 and states[index-X+1] == FieldState.BOX):
+                return True
+        return False
+
+def createInstance(seed):
+    # Magazine size, walls (walls[x + y*X]), boxes and genotypes (orders of the box indexes).
+    rng = random.Random(seed)
+    X, Y = rng.randint(1, 24), rng.randint(1, 24)
+    wall_probability = rng.choice([0.0, 0.05, 0.15, 0.4])
+    walls = [rng.random() < wall_probability for i in range(X*Y)]
+    if (rng.random() < 0.3):
+        # A wall line across the magazine.
+        y = rng.randrange(Y)
+        for x in range(X):
+            walls[x + y*X] = True
+    boxes = [Box(rng.randint(1, max(1, X//2) + 1), rng.randint(1, max(1, Y//2) + 1))
+             for i in range(rng.randint(1, 30))]
+    genotypes = []
+    for i in range(GENOTYPES):
+        genotype = list(range(len(boxes)))
+        rng.shuffle(genotype)
+        genotypes.append(genotype)
+    return (X, Y, walls, boxes, genotypes)
+
+def createMagazine(engine, X, Y, walls):
+    magazine = engine(X, Y)
+    for i, wall in enumerate(walls):
+        if (wall): magazine.setFieldStateToWall(i % X, i // X)
+    return magazine
+
+def decodeReference(X, Y, walls, boxes, genotype):
+    magazine = ReferenceMagazine(X, Y, walls)
+    inserted = [magazine.addBox(boxes[i]) for i in genotype]
+    return (magazine.fill_factor, inserted, magazine.placed_boxes)
+
+def getEngines():
+    # (engine, id, fields per box from which the bitmap engine removes the boxes box by box or None)
+    engines = [(Magazine, "Magazine", None)]
+    try:
+        from bitmap import BitmapMagazine
+        engines.append((BitmapMagazine, "BitmapMagazine", None))
+        # The test magazines are small, so without a lower threshold the boxes are never removed box by box.
+        engines.append((BitmapMagazine, "BitmapMagazine-local", 0))
+    except ImportError:
+        pass
+    return engines
+
+@pytest.fixture(params=getEngines(), ids=lambda e: e[1])
+def engine(request, monkeypatch):
+    engine, name, localUpdateFields = request.param
+    if (localUpdateFields is not None):
+        monkeypatch.setattr("bitmap.LOCAL_UPDATE_FIELDS", localUpdateFields)
+    return engine
+
+@pytest.mark.parametrize("seed", SEEDS)
+def testEngineMatchesReference(engine, seed):
+    X, Y, walls, boxes, genotypes = createInstance(seed)
+    # One magazine for all the genotypes, as in the algorithm, so removing the boxes is checked too.
+    magazine = createMagazine(engine, X, Y, walls)
+    for genotype in genotypes:
+        fill_factor, inserted, placed_boxes = decodeReference(X, Y, walls, boxes, genotype)
+        assert [magazine.addBox(boxes[i]) for i in genotype] == inserted
+        assert magazine.placed_boxes == placed_boxes
+        assert magazine.fill_factor == pytest.approx(fill_factor)
+        magazine.removeAllBoxes()
+        assert magazine.fill_factor == 0.0
+
+@pytest.mark.parametrize("seed", SEEDS)
+def testRestoreStateMatchesReference(engine, seed):
+    X, Y, walls, boxes, genotypes = createInstance(seed)
+    magazine = createMagazine(engine, X, Y, walls)
+    # Every genotype decoded from the state saved in the middle of the previous one,
+    # so the magazine goes back to states of different lengths, as with incremental decoding.
+    genotype = genotypes[0]
+    for count, second in enumerate(genotypes[1:]):
+        first = genotype
+        prefix = len(first) * (count % 3 + 1) // 4
+        magazine.restoreState((0.0, 0, ()))
+        for i in first[:prefix]:
+            magazine.addBox(boxes[i])
+        state = magazine.saveState()
+        for i in first[prefix:]:
+            magazine.addBox(boxes[i])
+        magazine.restoreState(state)
+        if (hasattr(magazine, "forbidden")):
+            # The forbidden fields of the bitmap engine, as if the saved boxes were put into an empty magazine.
+            restored = createMagazine(engine, X, Y, walls)
+            restored.restoreState(state)
+            assert (magazine.forbidden == restored.forbidden).all()
+        genotype = first[:prefix] + [i for i in second if i not in first[:prefix]]
+        for i in genotype[prefix:]:
+            magazine.addBox(boxes[i])
+        fill_factor, inserted, placed_boxes = decodeReference(X, Y, walls, boxes, genotype)
+        assert magazine.placed_boxes == placed_boxes
+        assert magazine.fill_factor == pytest.approx(fill_factor)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def testBatchEvaluatorMatchesReference(seed):
+    pytest.importorskip("numpy")
+    from batch import BatchEvaluator
+    X, Y, walls, boxes, genotypes = createInstance(seed)
+    evaluator = BatchEvaluator(createMagazine(Magazine, X, Y, walls), boxes)
+    expected = [decodeReference(X, Y, walls, boxes, g)[0] for g in genotypes]
+    assert evaluator.evaluate(genotypes) == pytest.approx(expected)
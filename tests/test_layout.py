@@ -0,0 +1,32 @@
+"""
+test_layout.py
+Loading and saving the layout files of layout.py.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+from layout import loadLayout, saveLayout
+from magazine import FieldState
+
+@pytest.mark.parametrize("name", ["layout.txt", "layout.pgm"])
+def testSavedLayoutLoadsBack(tmp_path, name):
+    layout = np.full((3, 5), FieldState.EMPTY.value, dtype=np.uint8)
+    layout[0, :] = FieldState.WALL.value
+    layout[1, 2:4] = FieldState.BOX.value
+    path = str(tmp_path / name)
+    saveLayout(path, layout)
+    assert (loadLayout(path) == layout).all()
+
+def testShortRowsAreFilledWithWalls(tmp_path):
+    path = tmp_path / "layout.txt"
+    path.write_bytes(b"..o\n.\n\n")
+    layout = loadLayout(str(path))
+    assert layout.shape == (2, 3)
+    assert layout[1, 1] == layout[1, 2] == FieldState.WALL.value
+
+@pytest.mark.parametrize("content", [b"", b"\n", b"\n\n", b"\r\n\r\n", b"P5 0 4 255\n"])
+def testLayoutWithoutFieldsIsRejected(tmp_path, content):
+    path = tmp_path / "layout.txt"
+    path.write_bytes(content)
+    with pytest.raises(ValueError, match="layout.txt"):
+        loadLayout(str(path))